@@ -44,11 +44,18 @@ Extensions to the Dulwich Git library.
 # stdlib
 import os
 import shutil
+import stat
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import closing, contextmanager
-from itertools import chain
+from heapq import merge
+from itertools import chain, groupby, repeat
 from operator import itemgetter
 from typing import (
 		IO,
+		Callable,
 		ContextManager,
 		Dict,
 		Iterator,
@@ -70,10 +77,10 @@ from domdf_python_tools.compat import nullcontext
 from domdf_python_tools.paths import PathPlus, maybe_make, unwanted_dirs
 from domdf_python_tools.typing import PathLike
 from dulwich.config import StackedConfig
-from dulwich.ignore import IgnoreFilterManager
-from dulwich.index import Index, get_unstaged_changes
-from dulwich.objects import Commit, ShaFile, Tag
-from dulwich.porcelain import default_bytes_err_stream, fetch, path_to_tree_path
+from dulwich.ignore import IgnoreFilterManager, default_user_ignore_filter_path
+from dulwich.index import Index, IndexEntry, blob_from_path_and_stat, cleanup_mode, read_submodule_head
+from dulwich.objects import S_ISGITLINK, Blob, Commit, ShaFile, Tag
+from dulwich.porcelain import default_bytes_err_stream, fetch
 from typing_extensions import TypedDict
 
 # this package
@@ -94,6 +101,7 @@ __all__ = [
 		"StagedDict",
 		"GitStatus",
 		"get_tree_changes",
+		"invalidate_ignore_cache",
 		"clone",
 		"_DR",
 		"open_repo_closing",
@@ -108,11 +116,16 @@ class StagedDict(TypedDict):
 	The values are lists of filenames, relative to the repository root.
 
 	.. versionadded:: 0.6.1
+
+	.. versionchanged:: 0.10.0
+
+		The filenames are now :class:`str` (with forward slashes as the separator)
+		rather than :class:`~domdf_python_tools.paths.PathPlus`.
 	"""
 
-	add: List[PathPlus]
-	delete: List[PathPlus]
-	modify: List[PathPlus]
+	add: List[str]
+	delete: List[str]
+	modify: List[str]
 
 
 class GitStatus(NamedTuple):
@@ -120,66 +133,141 @@ class GitStatus(NamedTuple):
 	Represents the output of :func:`~.status`.
 
 	.. versionadded:: 0.6.1
+
+	.. versionchanged:: 0.10.0
+
+		``unstaged`` and ``untracked`` are now lists of :class:`str`
+		(relative to the repository root, with forward slashes as the separator)
+		rather than :class:`~domdf_python_tools.paths.PathPlus`.
 	"""
 
 	#: Dict with lists of staged paths.
 	staged: StagedDict
 
 	#: List of unstaged paths.
-	unstaged: List[PathPlus]
+	unstaged: List[str]
 
 	#: List of untracked, un-ignored & non-.git paths.
-	untracked: List[PathPlus]
+	untracked: List[str]
+
+
+#: Cache of :func:`~.get_tags` results, keyed by the repository's common directory.
+_tags_cache: Dict[str, Tuple[Tuple[Optional[int], ...], Dict[str, str]]] = {}
+
+#: Files modified within this many nanoseconds may still change without their mtime changing,
+#: as some filesystems (e.g. FAT) only store timestamps to the nearest 2 seconds.
+_racy_window_ns = 2_000_000_000
+
+
+def _get_tags_signature(commondir: str) -> Tuple[Optional[int], ...]:
+	"""
+	Returns a signature which changes whenever a tag is added, removed or moved.
+
+	This consists of the mtime and size of ``packed-refs`` and the mtime of each directory under ``refs/tags``.
+	Git writes loose refs by renaming a lockfile into place, which updates the mtime of the containing directory.
+
+	:param commondir: The repository's common directory.
+	"""
+
+	signature: List[Optional[int]] = []
+
+	try:
+		packed_refs = os.stat(os.path.join(commondir, "packed-refs"))
+	except FileNotFoundError:
+		signature.extend((None, None))
+	else:
+		signature.extend((packed_refs.st_mtime_ns, packed_refs.st_size))
+
+	for dirpath, _, _ in os.walk(os.path.join(commondir, "refs", "tags")):
+		signature.append(os.stat(dirpath).st_mtime_ns)
+
+	return tuple(signature)
+
+
+def _get_newest_mtime(signature: Tuple[Optional[int], ...]) -> int:
+	"""
+	Returns the newest mtime in a signature returned by :func:`~._get_tags_signature`.
+
+	:param signature:
+	"""
+
+	# The second item is the size of packed-refs.
+	mtimes = [signature[0], *signature[2:]]
+	return max((mtime for mtime in mtimes if mtime is not None), default=0)
 
 
 def get_tags(repo: Union[dulwich.repo.Repo, PathLike] = '.') -> Dict[str, str]:
 	"""
 	Returns a mapping of commit SHAs to tags.
 
+	The result is cached, and reused until a tag is added, removed or moved.
+
 	:param repo:
+
+	.. versionchanged:: 0.10.0  The result is cached.
 	"""
 
 	tags: Dict[str, str] = {}
 
 	with open_repo_closing(repo) as r:
+		if isinstance(r, dulwich.repo.Repo):
+			commondir = os.path.abspath(r.commondir())
+			signature: Optional[Tuple[Optional[int], ...]] = _get_tags_signature(commondir)
+
+			if commondir in _tags_cache:
+				cached_signature, cached_tags = _tags_cache[commondir]
+				if cached_signature == signature:
+					return dict(cached_tags)
+		else:
+			# e.g. MemoryRepo, which has nothing on disk to check.
+			signature = None
+
 		raw_tags: Dict[bytes, bytes] = r.refs.as_dict(b"refs/tags")
+		object_store = r.object_store
+
 		for tag, sha, in raw_tags.items():
-			obj = r.get_object(sha)
+			obj = object_store[sha]
+
+			# SHAs are hex digits, so can skip UTF-8 decoding. Tag names may contain non-ASCII characters.
 			if isinstance(obj, Tag):
-				tags[obj.object[1].decode("UTF-8")] = tag.decode("UTF-8")
+				tags[obj.object[1].decode("ascii")] = tag.decode("UTF-8")
 			elif isinstance(obj, Commit):
-				tags[sha.decode("UTF-8")] = tag.decode("UTF-8")
+				tags[sha.decode("ascii")] = tag.decode("UTF-8")
+
+		# A tag written within the filesystem's timestamp resolution of the signature being taken
+		# might not change it, so the result is only cached once all the refs are older than that.
+		if signature is not None and _get_newest_mtime(signature) < time.time() * 1e9 - _racy_window_ns:
+			_tags_cache[commondir] = (signature, dict(tags))
 
 	return tags
 
 
-def assert_clean(repo: PathPlus, allow_config: Sequence[PathLike] = ()) -> bool:
+def assert_clean(repo: Union[dulwich.repo.Repo, PathLike], allow_config: Sequence[PathLike] = ()) -> bool:
 	"""
 	Returns :py:obj:`True` if the working directory is clean.
 
 	If not, returns :py:obj:`False` and prints a helpful error message to stderr.
 
-	:param repo:
+	:param repo: Path to repository or repository object.
 	:param allow_config:
+
+	.. versionchanged:: 0.10.0  ``repo`` may be a repository object, which is reused rather than reopened.
 	"""
 
-	allow_config = [PathPlus(filename) for filename in allow_config]
+	allowed_files = {PathPlus(filename).as_posix() for filename in allow_config}
 
 	stat = status(repo)
 
-	modified_files = chain.from_iterable([
+	modified_files = chain(
 			stat.staged["add"],
 			stat.staged["delete"],
 			stat.staged["modify"],
 			stat.unstaged,
-			])
+			)
 
-	if modified_files:
-		for filename in modified_files:
-			if filename not in allow_config:
-				break
-		else:
-			return True
+	# Stop at the first file which isn't allowed to be modified.
+	if all(filename in allowed_files for filename in modified_files):
+		return True
 
 	# If we get to here the directory isn't clean
 	echo(Fore.RED("Git working directory is not clean:"), err=True)
@@ -197,13 +285,15 @@ status_codes: Dict[str, str] = {
 		}
 
 
-def check_git_status(repo_path: PathLike) -> Tuple[bool, List[str]]:
+def check_git_status(repo_path: Union[dulwich.repo.Repo, PathLike]) -> Tuple[bool, List[str]]:
 	"""
 	Check the ``git`` status of the given repository.
 
-	:param repo_path: Path to the repository root.
+	:param repo_path: Path to the repository root, or the repository object.
 
 	:return: Whether the git working directory is clean, and the list of uncommitted files if it isn't.
+
+	.. versionchanged:: 0.10.0  ``repo_path`` may be a repository object, which is reused rather than reopened.
 	"""
 
 	str_lines = list(format_git_status(status(repo_path)))
@@ -231,64 +321,393 @@ def format_git_status(status: GitStatus) -> Iterator[str]:
 	.. versionadded:: 0.6.1
 	"""
 
-	files: Dict[bytes, str] = {}
+	# Each source is (normally) already in order, which Timsort handles in linear time.
+	staged = {key: sorted(status.staged[key]) for key in status_codes}  # type: ignore
+	unstaged = sorted(status.unstaged)
 
-	for key, code in status_codes.items():
-		for file in status.staged[key]:  # type: ignore
-			if file in files:
-				files[file] += code
-			else:
-				files[file] = code
+	# A file only has two codes if it is both staged and unstaged,
+	# so the column width is known without formatting every line first.
+	longest = 2 if set(unstaged).isdisjoint(chain.from_iterable(staged.values())) else 3
+
+	sources = [zip(staged[key], repeat(code)) for key, code in status_codes.items()]
+	sources.append(zip(unstaged, repeat('M')))
+
+	# Merge the sorted sources, then combine the codes for each file.
+	for file, group in groupby(merge(*sources), key=itemgetter(0)):
+		codes = ''.join(sorted(code for _, code in group))
+		yield f"{codes:<{longest}}{file}"
 
-	for file in status.unstaged:
-		if file in files:
-			files[file] += 'M'
+
+_IgnoreSignature = Tuple[Tuple[str, Optional[int], Optional[int]], ...]
+
+#: Cache of ignore managers, keyed by the repository's working tree, from least to most recently used.
+#: Each manager keeps the ``.gitignore`` files it has already parsed.
+_ignore_cache: Dict[str, Tuple[_IgnoreSignature, IgnoreFilterManager]] = OrderedDict()
+_ignore_cache_lock = threading.Lock()
+
+#: The maximum number of repositories whose ignore managers are cached.
+_ignore_cache_size = 16
+
+
+def _get_ignore_signature(
+		repo: dulwich.repo.Repo,
+		ignore_manager: IgnoreFilterManager,
+		) -> _IgnoreSignature:
+	"""
+	Returns a signature which changes whenever a file read by ``ignore_manager`` changes.
+
+	This consists of the mtime and size of the repository's config (which can set ``core.excludesFile``),
+	``info/exclude``, the user's global ignore file, and each ``.gitignore`` the manager has looked for.
+
+	:param repo:
+	:param ignore_manager:
+	"""
+
+	controldir = repo.controldir()
+	filenames = [
+			os.path.join(controldir, "config"),
+			os.path.join(controldir, "info", "exclude"),
+			os.path.expanduser(default_user_ignore_filter_path(repo.get_config_stack())),
+			]
+	filenames.extend(os.path.join(repo.path, path, ".gitignore") for path in ignore_manager._path_filters)
+
+	signature = []
+
+	for filename in filenames:
+		try:
+			st = os.stat(filename)
+		except OSError:
+			signature.append((filename, None, None))
 		else:
-			files[file] = 'M'
+			signature.append((filename, st.st_mtime_ns, st.st_size))
 
-	for file, codes in sorted(files.items(), key=itemgetter(0)):
-		longest = max(len(v) for v in files.values()) + 1
+	return tuple(signature)
 
-		status_code = ''.join(sorted(codes)).ljust(longest, ' ')
-		yield f"{status_code}{file!s}"
 
+def _get_ignore_manager(repo: dulwich.repo.Repo) -> IgnoreFilterManager:
+	"""
+	Returns the cached ignore manager for ``repo``, or a new one if the ignore files have changed.
 
-def get_untracked_paths(path: PathLike, index: Index) -> Iterator[str]:
+	:param repo:
 	"""
-	Returns a list of untracked files.
 
-	:param path: Path to walk.
-	:param index: Index to check against.
+	cached = _ignore_cache.get(os.path.abspath(repo.path))
+
+	if cached is not None:
+		cached_signature, ignore_manager = cached
+		if cached_signature == _get_ignore_signature(repo, ignore_manager):
+			return ignore_manager
+
+	return IgnoreFilterManager.from_repo(repo)
+
+
+def _cache_ignore_manager(repo: dulwich.repo.Repo, ignore_manager: IgnoreFilterManager) -> None:
+	"""
+	Store ``ignore_manager`` in the cache as the most recently used entry.
+
+	Entries for working trees which no longer exist (such as closed :class:`~.TarGit` archives)
+	are discarded, followed by the least recently used entries if the cache is still too large.
+
+	The manager is not cached if any of the ignore files were modified within the racy window,
+	as a further change within the mtime granularity might not change the signature.
+
+	:param repo:
+	:param ignore_manager:
+	"""
+
+	key = os.path.abspath(repo.path)
+	signature = _get_ignore_signature(repo, ignore_manager)
+	newest_mtime = max((mtime for _, mtime, _ in signature if mtime is not None), default=0)
+
+	with _ignore_cache_lock:
+		_ignore_cache.pop(key, None)
+
+		if newest_mtime >= time.time() * 1e9 - _racy_window_ns:
+			return
+
+		_ignore_cache[key] = (signature, ignore_manager)
+
+		for stale_key in [k for k in _ignore_cache if not os.path.isdir(k)]:
+			del _ignore_cache[stale_key]
+
+		while len(_ignore_cache) > _ignore_cache_size:
+			del _ignore_cache[next(iter(_ignore_cache))]
+
+
+def invalidate_ignore_cache() -> None:
 	"""
+	Discard the cached ``.gitignore`` rules used by :func:`~.status`.
+
+	The cache is checked against the ignore files on each call, so this is only needed
+	if they are changed without their mtime or size changing.
+
+	.. versionadded:: 0.10.0
+	"""
+
+	with _ignore_cache_lock:
+		_ignore_cache.clear()
 
-	path = str(path)
 
-	for dirpath, dirnames, filenames in os.walk(path):
-		# Skip .git etc. and below.
-		for exclude in unwanted_dirs:
-			if exclude in dirnames:
-				dirnames.remove(exclude)
+#: Names of files and directories which are never reported as untracked, at any depth.
+_status_excludes = frozenset(os.fsencode(name) for name in unwanted_dirs)
 
-				if dirpath != path:
-					continue
 
-			if exclude in filenames:
-				filenames.remove(exclude)
+#: The number of entries the working tree walk sees before it starts scanning directories in parallel.
+_parallel_walk_threshold = 500
 
-				if dirpath != path:
-					continue
+#: The maximum number of threads used to scan directories in parallel.
+_max_walk_workers = min(8, os.cpu_count() or 1)
 
-		for filename in filenames:
-			filepath = os.path.join(dirpath, filename)
 
-			_pp_filename = (PathPlus(path) / filepath)
-			if _pp_filename.is_symlink() and not _pp_filename.resolve().is_relative_to(path):
+def _scan_directory(
+		path: bytes,
+		treedir: bytes,
+		ignore_manager: Optional[IgnoreFilterManager],
+		root_prefix: bytes,
+		) -> Tuple[List[Tuple[bytes, bytes]], List[bytes]]:
+	"""
+	Scan a single directory of the working tree.
+
+	Returns the filesystem path and tree path of each file in the directory,
+	and the tree paths of the subdirectories which should be walked.
+
+	:param path: The root of the working tree.
+	:param treedir: The tree path of the directory to scan, or ``b''`` for the root.
+	:param ignore_manager: If given, ignored directories are not returned.
+	:param root_prefix: The resolved path of the working tree, with a trailing separator.
+	"""
+
+	sep = os.fsencode(os.sep)
+	files: List[Tuple[bytes, bytes]] = []
+	subdirs: List[bytes] = []
+
+	try:
+		scandir_it = os.scandir(os.path.join(path, treedir.replace(b'/', sep)))
+	except OSError:
+		# Unreadable directories are skipped, as with os.walk
+		return files, subdirs
+
+	# Work done once per directory rather than once per entry.
+	prefix = treedir + b'/' if treedir else b''
+
+	with scandir_it:
+		for entry in scandir_it:
+			# Skip .git etc. and below, at every level.
+			if entry.name in _status_excludes:
 				continue
 
-			ip = path_to_tree_path(path, filepath)
+			tree_path = prefix + entry.name
+
+			# DirEntry caches the file type from readdir, so these checks don't usually need a syscall.
+			if entry.is_dir(follow_symlinks=False):
+				# Ignored directories are never walked.
+				if ignore_manager is None or not ignore_manager.is_ignored(os.fsdecode(tree_path) + '/'):
+					subdirs.append(tree_path)
+
+			elif entry.is_symlink():
+				target = os.path.realpath(entry.path)
+				if target.startswith(root_prefix):
+					files.append((entry.path, tree_path))
+
+			else:
+				files.append((entry.path, tree_path))
+
+	return files, subdirs
+
+
+def _iter_working_tree(
+		path: bytes,
+		ignore_manager: Optional[IgnoreFilterManager],
+		) -> Iterator[Tuple[bytes, bytes]]:
+	"""
+	Walk the working tree at ``path``, yielding the filesystem path and tree path of each file.
+
+	Tree paths are relative to ``path`` and use ``/`` as the separator, as in the index.
+	The walk is done entirely in :class:`bytes`, so no paths need to be encoded or decoded.
+
+	``.git`` etc. are skipped, as are symlinks which point outside of ``path``.
+	Symlinks are never followed, and are yielded as files like git does.
+
+	Small trees are walked in the current thread. Once the walk has seen more than
+	``_parallel_walk_threshold`` entries the remaining directories are scanned by a thread pool,
+	as the scans mostly wait on syscalls which release the GIL.
+	Directories are still yielded in the order they were queued, so the output doesn't depend on the
+	number of threads.
+
+	:param path:
+	:param ignore_manager: If given, ignored directories are not walked.
+	"""
+
+	root_prefix = os.path.realpath(path) + os.fsencode(os.sep)
+	pending: "deque[Union[bytes, Future]]" = deque([b''])
+	executor: Optional[ThreadPoolExecutor] = None
+	seen = 0
+
+	def scan(treedir: bytes) -> Tuple[List[Tuple[bytes, bytes]], List[bytes]]:
+		return _scan_directory(path, treedir, ignore_manager, root_prefix)
+
+	try:
+		while pending:
+			item = pending.popleft()
+
+			if executor is None:
+				files, subdirs = scan(item)  # type: ignore[arg-type]
+			else:
+				files, subdirs = item.result()  # type: ignore[union-attr]
+
+			yield from files
+
+			seen += len(files) + len(subdirs)
+			if executor is None and seen > _parallel_walk_threshold and _max_walk_workers > 1:
+				executor = ThreadPoolExecutor(max_workers=_max_walk_workers)
+				pending = deque(executor.submit(scan, treedir) for treedir in pending)  # type: ignore[arg-type]
+
+			if executor is None:
+				pending.extend(subdirs)
+			else:
+				pending.extend(executor.submit(scan, treedir) for treedir in subdirs)
+
+	finally:
+		if executor is not None:
+			# The generator may be closed early; don't scan directories nobody will read.
+			for future in pending:
+				future.cancel()  # type: ignore[union-attr]
+			executor.shutdown(wait=True)
+
+
+def _entry_seconds(timestamp: Union[int, float, Tuple[int, int]]) -> int:
+	# Dulwich records index times as either seconds or (seconds, nanoseconds)
+	if isinstance(timestamp, tuple):
+		return timestamp[0]
+	return int(timestamp)
+
+
+def _stat_matches_entry(st: os.stat_result, entry: IndexEntry, index_mtime: float) -> bool:
+	"""
+	Returns whether the stat information for a file matches its entry in the index, in the same way as git.
+
+	Entries modified in the same second as the index was written are "racily clean"
+	and never match, as the file may have been changed again without its mtime changing.
+
+	:param st:
+	:param entry:
+	:param index_mtime: The modification time of the index file.
+	"""
+
+	mtime = _entry_seconds(entry.mtime)
 
-			if ip not in index:
-				yield os.path.relpath(filepath, path)
+	if mtime >= int(index_mtime):
+		return False
+
+	# The index stores the size and inode as 32-bit integers.
+	return (
+			mtime == int(st.st_mtime) and _entry_seconds(entry.ctime) == int(st.st_ctime)
+			and entry.size == st.st_size & 0xFFFFFFFF and entry.ino == st.st_ino & 0xFFFFFFFF
+			and entry.mode == cleanup_mode(st.st_mode)
+			)
+
+
+def _has_unstaged_changes(
+		fs_path: bytes,
+		tree_path: bytes,
+		entry: IndexEntry,
+		filter_callback: Optional[Callable[[Blob, bytes], Blob]] = None,
+		index_mtime: Optional[float] = None,
+		) -> bool:
+	"""
+	Returns whether the file at ``fs_path`` differs from its entry in the index.
+
+	If the file's stat information matches that recorded in the index the file is assumed
+	to be unchanged, and its contents are not read.
+
+	:param fs_path: The absolute path of the file.
+	:param tree_path: The path of the file relative to the repository root, as stored in the index.
+	:param entry: The file's entry in the index.
+	:param filter_callback: Optional callback to normalise the file's contents before comparison.
+	:param index_mtime: The modification time of the index file.
+		If :py:obj:`None` the stat information is not trusted and the contents are always compared.
+	"""
+
+	if not isinstance(entry, IndexEntry):
+		# Conflicted files are always unstaged
+		return True
+
+	try:
+		st = os.lstat(fs_path)
+	except FileNotFoundError:
+		# The file was removed, which counts as a change.
+		return True
+
+	if stat.S_ISDIR(st.st_mode):
+		if S_ISGITLINK(entry.mode):
+			return read_submodule_head(fs_path) != entry.sha
+		else:
+			# The file was replaced with a directory.
+			return True
+
+	if not stat.S_ISREG(st.st_mode) and not stat.S_ISLNK(st.st_mode):
+		return False
+
+	if index_mtime is not None and _stat_matches_entry(st, entry, index_mtime):
+		return False
+
+	blob = blob_from_path_and_stat(fs_path, st)
+
+	if filter_callback is not None:
+		blob = filter_callback(blob, tree_path)
+
+	return blob.id != entry.sha
+
+
+def get_untracked_paths(
+		path: PathLike,
+		index: Index,
+		ignore_manager: Optional[IgnoreFilterManager] = None,
+		) -> Iterator[str]:
+	"""
+	Returns a list of untracked files.
+
+	:param path: Path to walk.
+	:param index: Index to check against.
+	:param ignore_manager: If given, ignored files are omitted and ignored directories are not walked.
+
+	.. versionchanged:: 0.10.0  Added the ``ignore_manager`` argument.
+	"""
+
+	# Plain bytes set of tree paths, so each file costs one hash lookup.
+	tracked = set(index)
+
+	for _, tree_path in _iter_working_tree(os.fsencode(path), ignore_manager):
+		if tree_path not in tracked:
+			relpath = os.fsdecode(tree_path)
+			if ignore_manager is None or not ignore_manager.is_ignored(relpath):
+				yield os.path.normpath(relpath)
+
+
+def _get_tree_changes(repo: dulwich.repo.Repo, index: Index) -> StagedDict:
+	# Compares the Index to the HEAD & determines changes
+	# Iterate through the changes and report add/delete/modify
+	# TODO: call out to dulwich.diff_tree somehow.
+	tracked_changes: StagedDict = {
+			"add": [],
+			"delete": [],
+			"modify": [],
+			}
+	try:
+		tree_id = repo[b'HEAD'].tree  # type: ignore
+	except KeyError:
+		tree_id = None
+
+	for change in index.changes_from_tree(repo.object_store, tree_id):
+		if not change[0][0]:
+			tracked_changes["add"].append(change[0][1].decode("UTF-8"))
+		elif not change[0][1]:
+			tracked_changes["delete"].append(change[0][0].decode("UTF-8"))
+		elif change[0][0] == change[0][1]:
+			tracked_changes["modify"].append(change[0][0].decode("UTF-8"))
+		else:
+			raise NotImplementedError("git mv ops not yet supported")
+	return tracked_changes
 
 
 def get_tree_changes(repo: Union[PathLike, dulwich.repo.Repo]) -> StagedDict:
@@ -303,31 +722,7 @@ def get_tree_changes(repo: Union[PathLike, dulwich.repo.Repo]) -> StagedDict:
 	"""
 
 	with open_repo_closing(repo) as r:
-		index = r.open_index()
-
-		# Compares the Index to the HEAD & determines changes
-		# Iterate through the changes and report add/delete/modify
-		# TODO: call out to dulwich.diff_tree somehow.
-		tracked_changes: StagedDict = {
-				"add": [],
-				"delete": [],
-				"modify": [],
-				}
-		try:
-			tree_id = r[b'HEAD'].tree  # type: ignore
-		except KeyError:
-			tree_id = None
-
-		for change in index.changes_from_tree(r.object_store, tree_id):
-			if not change[0][0]:
-				tracked_changes["add"].append(PathPlus(change[0][1].decode("UTF-8")))
-			elif not change[0][1]:
-				tracked_changes["delete"].append(PathPlus(change[0][0].decode("UTF-8")))
-			elif change[0][0] == change[0][1]:
-				tracked_changes["modify"].append(PathPlus(change[0][0].decode("UTF-8")))
-			else:
-				raise NotImplementedError("git mv ops not yet supported")
-		return tracked_changes
+		return _get_tree_changes(r, r.open_index())
 
 
 def status(repo: Union[dulwich.repo.Repo, PathLike] = '.') -> GitStatus:
@@ -338,24 +733,53 @@ def status(repo: Union[dulwich.repo.Repo, PathLike] = '.') -> GitStatus:
 	"""
 
 	with open_repo_closing(repo) as r:
+		index = r.open_index()
+
 		# 1. Get status of staged
-		tracked_changes = get_tree_changes(r)
+		tracked_changes = _get_tree_changes(r, index)
 
-		# 2. Get status of unstaged
-		index = r.open_index()
-		normalizer = r.get_blob_normalizer()
-		filter_callback = normalizer.checkin_normalize
-		unstaged_changes = [
-				PathPlus(p.decode("UTF-8")) for p in get_unstaged_changes(index, str(r.path), filter_callback)
-				]
-
-		# Remove ignored files
-		ignore_manager = IgnoreFilterManager.from_repo(r)
-		untracked_changes = [
-				PathPlus(p) for p in get_untracked_paths(r.path, index) if not ignore_manager.is_ignored(p)
-				]
-
-		return GitStatus(tracked_changes, unstaged_changes, untracked_changes)
+		# 2. Get status of unstaged and untracked, in a single walk of the working tree.
+		path = os.fsencode(r.path)
+		filter_callback = r.get_blob_normalizer().checkin_normalize
+		ignore_manager = _get_ignore_manager(r)
+
+		try:
+			index_mtime: Optional[float] = os.stat(r.index_path()).st_mtime
+		except FileNotFoundError:
+			index_mtime = None
+
+		entries = dict(index.iteritems())
+		unstaged_changes: List[bytes] = []
+		untracked_changes: List[str] = []
+
+		for fs_path, tree_path in _iter_working_tree(path, ignore_manager):
+			entry = entries.pop(tree_path, None)
+
+			if entry is None:
+				# Ignored files are only checked for untracked paths, never for tracked ones.
+				relpath = os.fsdecode(tree_path)
+				if not ignore_manager.is_ignored(relpath):
+					untracked_changes.append(relpath)
+			elif _has_unstaged_changes(fs_path, tree_path, entry, filter_callback, index_mtime):
+				unstaged_changes.append(tree_path)
+
+		# Tracked files the walk didn't reach: deleted, or inside excluded or ignored directories.
+		sep = os.fsencode(os.sep)
+		for tree_path, entry in entries.items():
+			fs_path = os.path.join(path, tree_path.replace(b'/', sep))
+			if _has_unstaged_changes(fs_path, tree_path, entry, filter_callback, index_mtime):
+				unstaged_changes.append(tree_path)
+
+		# Recorded after the walk so the signature covers every .gitignore that was read.
+		_cache_ignore_manager(r, ignore_manager)
+
+		unstaged_changes.sort()
+
+		return GitStatus(
+				tracked_changes,
+				[p.decode("UTF-8") for p in unstaged_changes],
+				untracked_changes,
+				)
 
 
 def clone(
@@ -91,10 +91,12 @@ def get_remotes(config: ConfigFile) -> Dict[str, str]:
 
 	remotes = {}
 
-	for key in list(config.keys()):
-		if key[0] == b"remote":
-			url = config.get(key, "url")
-			if url is not None:
-				remotes[key[1].decode("UTF-8")] = url.decode("UTF-8")
+	for section in config.keys():
+		if section[0] != b"remote":
+			continue
+
+		url = config.get(section, "url")
+		if url is not None:
+			remotes[section[1].decode("UTF-8")] = url.decode("UTF-8")
 
 	return remotes
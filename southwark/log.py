@@ -27,17 +27,18 @@ Python implementation of ``git log``.
 #
 
 # stdlib
-import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
 from textwrap import indent
-from typing import Dict, Mapping, Optional, Union
+from typing import IO, Dict, FrozenSet, List, Mapping, Optional, Union
 
 # 3rd party
 import dulwich.repo
-from consolekit.terminal_colours import Fore, strip_ansi
-from domdf_python_tools.stringlist import DelimitedList, StringList
+from consolekit.terminal_colours import Fore
+from domdf_python_tools.stringlist import DelimitedList
 from domdf_python_tools.typing import PathLike
 from dulwich.objects import Commit, format_timezone
+from dulwich.walk import Walker
 
 # this package
 from southwark import get_tags
@@ -49,6 +50,49 @@ yellow_meta_left = Fore.YELLOW(" (")
 yellow_meta_comma = Fore.YELLOW(", ")
 yellow_meta_right = Fore.YELLOW(')')
 
+# The escape sequences and meta separators used by format_commit, keyed by whether colour is enabled.
+_colours = {
+		True: (
+				(str(Fore.BLUE), str(Fore.GREEN), str(Fore.RED), str(Fore.YELLOW), str(Fore.RESET)),
+				(yellow_meta_left, yellow_meta_comma, yellow_meta_right),
+				),
+		False: (('', '', '', '', ''), (" (", ", ", ')')),
+		}
+
+_weekdays = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_epoch = datetime(1970, 1, 1)
+
+
+def _format_date(timestamp: int) -> str:
+	"""
+	Format the given timestamp as e.g. ``Thu Oct 15 2020 13:34:12``.
+
+	This is equivalent to ``time.strftime("%a %b %d %Y %H:%M:%S", time.gmtime(timestamp))``
+	in the C locale, without the overhead of :func:`time.strftime`.
+
+	:param timestamp: Seconds since the epoch, already adjusted for the timezone.
+	"""
+
+	dt = _epoch + timedelta(seconds=timestamp)
+	return (
+			f"{_weekdays[dt.weekday()]} {_months[dt.month - 1]} {dt.day:02d} {dt.year} "
+			f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+			)
+
+
+@lru_cache()
+def _format_timezone(offset: int) -> str:
+	"""
+	Format the given timezone offset as e.g. ``+0100``.
+
+	Most commits in a repository share a handful of timezones, so the result is cached.
+
+	:param offset: Timezone offset in seconds.
+	"""
+
+	return format_timezone(offset).decode("ascii")
+
 
 class Log:
 	"""
@@ -68,16 +112,11 @@ class Log:
 		else:
 			self.repo = Repo(repo)
 
-		#: Mapping of commit SHAs to tags.
-		self.tags = get_tags(self.repo)
+		self._tags: Optional[Dict[str, str]] = None
+		self._tag_names: Optional[FrozenSet[str]] = None
 
 		#: Mapping of git refs to commit SHAs.
-		self.refs: Dict[str, str] = {
-				k.decode("UTF-8"): v.decode("UTF-8")
-				for k,
-				v in self.repo.get_refs().items()
-				if not k.startswith(b"refs/tags/")
-				}
+		self.refs: Dict[str, str] = {}
 
 		#: Mapping of local branches to the SHA of the latest commit in that branch.
 		self.local_branches: Dict[str, str] = {}
@@ -88,50 +127,92 @@ class Log:
 		#: The name of the current branch
 		self.current_branch: str = self.repo.refs.follow(b"HEAD")[0][1].decode("UTF-8")[11:]
 
-		for key, value in self.refs.items():
-			if key.startswith("refs/heads/"):
-				self.local_branches[key[11:]] = value
-			elif key.startswith("refs/remotes/"):
-				self.remote_branches[key[13:]] = value
+		# The SHA HEAD points to, and reverse indexes of commit SHAs to branch names,
+		# so format_commit can compare raw SHAs rather than scanning every branch.
+		self._head_sha: Optional[bytes] = None
+		self._sha_to_local: Dict[bytes, List[str]] = {}
+		self._sha_to_remote: Dict[bytes, List[str]] = {}
+
+		# A single pass over the refs, decoding each one once.
+		for key, value in self.repo.get_refs().items():
+			if key.startswith(b"refs/tags/"):
+				continue
+
+			ref = key.decode("UTF-8")
+			sha = value.decode("UTF-8")
+			self.refs[ref] = sha
+
+			if key == b"HEAD":
+				self._head_sha = value
+			elif key.startswith(b"refs/heads/"):
+				self.local_branches[ref[11:]] = sha
+				self._sha_to_local.setdefault(value, []).append(ref[11:])
+			elif key.startswith(b"refs/remotes/"):
+				self.remote_branches[ref[13:]] = sha
+				self._sha_to_remote.setdefault(value, []).append(ref[13:])
+
+	@property
+	def tags(self) -> Dict[str, str]:
+		"""
+		Mapping of commit SHAs to tags.
+
+		This is loaded the first time it is accessed.
+
+		.. versionchanged:: 0.10.0  Changed from an attribute set in ``__init__`` to a lazily-loaded property.
+		"""
+
+		if self._tags is None:
+			self._tags = get_tags(self.repo)
+
+		return self._tags
 
 	# Based on https://www.dulwich.io/code/dulwich/blob/master/dulwich/porcelain.py
-	def format_commit(self, commit: Commit) -> StringList:
+	def format_commit(self, commit: Commit, colour: bool = True) -> str:
 		"""
 		Return a human-readable commit log entry.
 
 		:param commit: A `Commit` object
+		:param colour: Show coloured output.
+
+		.. versionchanged:: 0.10.0
+
+			* Added the ``colour`` argument.
+			* Now returns a :class:`str` rather than a :class:`~domdf_python_tools.stringlist.StringList`.
 		"""
 
-		buf = StringList()
+		(blue, green, red, yellow, reset), (meta_left, meta_comma, meta_right) = _colours[bool(colour)]
+
+		buf: List[str] = []
 		meta = []
-		commit_id = commit.id.decode("UTF-8")
+		commit_id = commit.id
+		is_head = commit_id == self._head_sha
+		local_branches = self._sha_to_local.get(commit_id, ())
+		remote_branches = self._sha_to_remote.get(commit_id, ())
 
-		if "HEAD" in self.refs and self.refs["HEAD"] == commit_id:
-			for branch, sha in self.local_branches.items():
-				if sha == commit_id and branch == self.current_branch:
-					meta.append(Fore.BLUE("HEAD -> ") + Fore.GREEN(branch))
-					break
+		# SHAs are hex digits, so can skip UTF-8 decoding.
+		hex_sha = commit_id.decode("ascii")
 
-		if commit_id in self.tags:
-			meta.append(Fore.YELLOW(f"tag: {self.tags[commit_id]}"))
+		if is_head and self.current_branch in local_branches:
+			meta.append(f"{blue}HEAD -> {reset}{green}{self.current_branch}{reset}")
 
-		for branch, sha in self.remote_branches.items():
-			if sha == commit_id:
-				meta.append(Fore.RED(branch))
-				break
+		if hex_sha in self.tags:
+			meta.append(f"{yellow}tag: {self.tags[hex_sha]}{reset}")
+
+		if remote_branches:
+			meta.append(f"{red}{remote_branches[0]}{reset}")
 
-		if "HEAD" in self.refs and self.refs["HEAD"] == commit_id:
-			for branch, sha in self.local_branches.items():
-				if sha == commit_id and branch != self.current_branch:
-					meta.append(Fore.GREEN(branch))
+		if is_head:
+			for branch in local_branches:
+				if branch != self.current_branch:
+					meta.append(f"{green}{branch}{reset}")
 					break
 
 		if meta:
-			meta_string = yellow_meta_left + yellow_meta_comma.join(meta) + yellow_meta_right
+			meta_string = meta_left + meta_comma.join(meta) + meta_right
 		else:
 			meta_string = ''
 
-		buf.append(Fore.YELLOW("commit: " + commit.id.decode("UTF-8") + meta_string))
+		buf.append(f"{yellow}commit: {hex_sha}{meta_string}{reset}")
 
 		if len(commit.parents) > 1:
 			parents = DelimitedList(c.decode("UTF-8") for c in commit.parents[1:])
@@ -142,16 +223,18 @@ class Log:
 		if commit.author != commit.committer:
 			buf.append("Committer: " + commit.committer.decode("UTF-8"))
 
-		time_tuple = time.gmtime(commit.author_time + commit.author_timezone)
-		time_str = time.strftime("%a %b %d %Y %H:%M:%S", time_tuple)
-		timezone_str = format_timezone(commit.author_timezone).decode("UTF-8")
-		buf.append(f"Date:   {time_str} {timezone_str}")
+		date_str = _format_date(commit.author_time + commit.author_timezone)
+		buf.append(f"Date:   {date_str} {_format_timezone(commit.author_timezone)}")
 
-		buf.blankline()
-		buf.append(indent(commit.message.decode("UTF-8"), "    "))
-		buf.blankline(ensure_single=True)
+		buf.append('')
 
-		return buf
+		# Without trailing whitespace, and followed by exactly one blank line.
+		buf.extend(line.rstrip() for line in indent(commit.message.decode("UTF-8"), "    ").split('\n'))
+		while not buf[-1]:
+			buf.pop()
+		buf.append('')
+
+		return '\n'.join(buf)
 
 	def log(
 			self,
@@ -172,30 +255,89 @@ class Log:
 		:param colour: Show coloured output.
 		"""
 
+		pieces: List[str] = []
+
+		for entry in self._get_walker(max_entries, reverse, from_date, from_tag):
+			formatted = self.format_commit(entry.commit, colour=colour)
+			pieces.append(formatted)
+
+			if from_tag and self._is_tagged(entry.commit, from_tag):
+				if reverse:
+					pieces = [formatted]
+				else:
+					break
+
+		return '\n'.join(pieces)
+
+	def stream_log(
+			self,
+			out: IO[str],
+			max_entries: Optional[int] = None,
+			reverse: bool = False,
+			from_date: Optional[datetime] = None,
+			from_tag: Optional[str] = None,
+			colour: bool = True
+			) -> None:
+		"""
+		Write the formatted commit log to ``out``, one commit at a time.
+
+		The output is the same as :meth:`~.log`, but the whole log is never held in memory.
+
+		:param out: The text stream to write to.
+		:param max_entries: Maximum number of entries to display
+		:default max_entries: all entries
+		:param reverse: Print entries in reverse order.
+		:param from_date: Show commits after the given date.
+		:param from_tag: Show commits after the given tag.
+		:param colour: Show coloured output.
+
+		.. versionadded:: 0.10.0
+		"""
+
+		if reverse and from_tag:
+			# Earlier commits are only known to be unwanted once the tag is reached,
+			# and the walker reads the whole history to reverse it anyway.
+			out.write(self.log(max_entries, reverse, from_date, from_tag, colour))
+			return
+
+		for idx, entry in enumerate(self._get_walker(max_entries, reverse, from_date, from_tag)):
+			if idx:
+				out.write('\n')
+
+			out.write(self.format_commit(entry.commit, colour=colour))
+
+			if from_tag and self._is_tagged(entry.commit, from_tag):
+				break
+
+	def _get_walker(
+			self,
+			max_entries: Optional[int],
+			reverse: bool,
+			from_date: Optional[datetime],
+			from_tag: Optional[str],
+			) -> Walker:
+		"""
+		Validate the arguments to :meth:`~.log` and return a walker over the requested commits.
+		"""
+
 		kwargs: Mapping[str, Union[None, int, bool]] = dict(max_entries=max_entries, reverse=reverse)
 
 		if from_date is not None and from_tag is not None:
 			raise ValueError("'from_date' and 'from_tag' are exclusive.")
 		elif from_date:
 			kwargs["since"] = from_date.timestamp()  # type: ignore
-		elif from_tag and not any(from_tag == tag for tag in self.tags.values()):
-			raise ValueError(f"No such tag {from_tag!r}")
+		elif from_tag:
+			if self._tag_names is None:
+				self._tag_names = frozenset(self.tags.values())
+			if from_tag not in self._tag_names:
+				raise ValueError(f"No such tag {from_tag!r}")
 
-		buf = StringList()
-		walker = self.repo.get_walker(**kwargs)
+		return self.repo.get_walker(**kwargs)
 
-		for entry in walker:
-			buf.append(str(self.format_commit(entry.commit)))
-
-			if from_tag:
-				commit_id = entry.commit.id.decode("UTF-8")
-				if commit_id in self.tags and self.tags[commit_id] == from_tag:
-					if reverse:
-						buf = StringList([str(self.format_commit(entry.commit))])
-					else:
-						break
+	def _is_tagged(self, commit: Commit, tag: str) -> bool:
+		"""
+		Returns whether ``commit`` has the tag ``tag``.
+		"""
 
-		if colour:
-			return str(buf)
-		else:
-			return strip_ansi(str(buf))
+		commit_id = commit.id.decode("ascii")
+		return commit_id in self.tags and self.tags[commit_id] == tag
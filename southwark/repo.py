@@ -44,8 +44,9 @@ Modified Dulwich repository object.
 
 # stdlib
 import os
+import re
 from itertools import chain
-from typing import Any, Dict, Iterator, Optional, Set, Type, TypeVar, Union, cast
+from typing import Any, Dict, Iterator, Optional, Set, Tuple, Type, TypeVar, Union, cast
 
 # 3rd party
 import click
@@ -56,7 +57,10 @@ from domdf_python_tools.paths import PathPlus
 from domdf_python_tools.typing import PathLike
 from dulwich import repo
 from dulwich.config import StackedConfig
-from dulwich.objects import Commit, Tree, TreeEntry
+from dulwich.objects import Commit
+
+# this package
+import southwark
 
 __all__ = ["get_user_identity", "Repo", "_R"]
 
@@ -84,6 +88,63 @@ def get_user_identity(config: StackedConfig, kind: Optional[str] = None) -> byte
 	:returns: A user identity
 	"""
 
+	return _make_user_identity(_get_config_identity(config), kind)
+
+
+#: The current user's identity as obtained from the host system, once it has been looked up.
+_default_identity: Optional[Tuple[str, str]] = None
+
+
+def _get_default_identity() -> Tuple[str, str]:
+	"""
+	Returns the current user's name and email address as obtained from the host system.
+
+	This doesn't change while the process runs, so is only looked up once.
+	"""
+
+	global _default_identity
+
+	if _default_identity is None:
+		_default_identity = repo._get_default_identity()  # type: ignore
+
+	return _default_identity
+
+
+def _get_config_identity(config: StackedConfig) -> Tuple[Optional[bytes], Optional[bytes]]:
+	"""
+	Returns the ``user.name`` and ``user.email`` settings from the given configuration.
+
+	Either value is :py:obj:`None` if it is not set.
+
+	:param config:
+	"""
+
+	try:
+		user = config.get(("user", ), "name")
+	except KeyError:
+		user = None
+
+	try:
+		email = config.get(("user", ), "email")
+	except KeyError:
+		email = None
+
+	return user, email
+
+
+def _make_user_identity(
+		config_identity: Tuple[Optional[bytes], Optional[bytes]],
+		kind: Optional[str] = None,
+		) -> bytes:
+	"""
+	Determine the identity to use for new commits, given the name and email from the configuration.
+
+	See :func:`~.get_user_identity` for the order in which the sources are checked.
+
+	:param config_identity: The output of :func:`~._get_config_identity`.
+	:param kind: Optional kind to return identity for, usually either ``'AUTHOR'`` or ``'COMMITTER'``.
+	"""
+
 	user: Optional[bytes] = None
 	email: Optional[bytes] = None
 
@@ -96,19 +157,13 @@ def get_user_identity(config: StackedConfig, kind: Optional[str] = None) -> byte
 			email = email_uc.encode("UTF-8")
 
 	if user is None:
-		try:
-			user = config.get(("user", ), "name")
-		except KeyError:
-			user = None
+		user = config_identity[0]
 
 	if email is None:
-		try:
-			email = config.get(("user", ), "email")
-		except KeyError:
-			email = None
+		email = config_identity[1]
 
 	if user is None or email is None:
-		default_user, default_email = repo._get_default_identity()  # type: ignore
+		default_user, default_email = _get_default_identity()
 
 		if user is None:
 			user = default_user.encode("UTF-8")
@@ -180,14 +235,16 @@ class Repo(repo.Repo):
 		:returns: New commit SHA1
 		"""
 
-		config = self.get_config_stack()
+		if committer is None or author is None:
+			# Read the configuration once, for both the committer and the author.
+			config_identity = _get_config_identity(self.get_config_stack())
 
 		if committer is None:
-			committer = get_user_identity(config, kind="COMMITTER")
+			committer = _make_user_identity(config_identity, kind="COMMITTER")
 
 		if author is None:
 			try:
-				author = get_user_identity(config, kind="AUTHOR")
+				author = _make_user_identity(config_identity, kind="AUTHOR")
 			except ModuleNotFoundError as e:
 				if str(e) == "No module named 'pwd'":
 					author = committer
@@ -254,9 +311,9 @@ class Repo(repo.Repo):
 		remotes = {}
 		config = self.get_config()
 
-		for key in list(config.keys()):
-			if key[0] == b"remote":
-				remotes[key[1].decode("UTF-8")] = config.get(key, "url").decode("UTF-8")
+		for section in config.keys():
+			if section[0] == b"remote":
+				remotes[section[1].decode("UTF-8")] = config.get(section, "url").decode("UTF-8")
 
 		return remotes
 
@@ -273,17 +330,15 @@ class Repo(repo.Repo):
 		:param sha:
 		"""
 
-		# this package
-		from southwark import status
-
 		if isinstance(sha, str):
 			sha = sha.encode("UTF-8")
 
 		index = self.open_index()
 		directory = PathPlus(self.path)
+		fs_directory = os.fsencode(self.path)
 
-		tree_for_sha: Tree = cast(Commit, self[sha]).tree
-		tree_for_head: Tree = cast(Commit, self[b'HEAD']).tree
+		tree_for_sha: bytes = cast(Commit, self[sha]).tree
+		tree_for_head: bytes = cast(Commit, self[b'HEAD']).tree
 
 		dulwich.index.build_index_from_tree(
 				root_path=directory,
@@ -294,16 +349,14 @@ class Repo(repo.Repo):
 
 		try:
 			# Based on https://github.com/dulwich/dulwich/issues/588#issuecomment-348412641
-			oldtree: Tree = cast(Tree, self[tree_for_head])
-			newtree: Tree = cast(Tree, self[tree_for_sha])
-
-			contents_iterator: Iterator[TreeEntry] = self.object_store.iter_tree_contents(newtree.id)
-			desired_filenames = [f.path for f in contents_iterator]
-
-			for f in self.object_store.iter_tree_contents(oldtree.id):
-				if f.path not in desired_filenames:
+			# Only the entries which differ between the trees are walked.
+			# A path whose type changed (e.g. from a file to a symlink) is reported as a modification,
+			# not as a delete and an add, as it was checked out by build_index_from_tree above.
+			changes = self.object_store.tree_changes(tree_for_head, tree_for_sha, change_type_same=True)
+			for (old_path, new_path), _, _ in changes:
+				if new_path is None:
 					# delete files that were in old branch, but not new
-					(directory / f.path.decode("UTF-8")).unlink()
+					os.unlink(os.path.join(fs_directory, old_path))
 
 		except KeyError:
 			click.echo("Unable to delete files added in later commits", err=True)
@@ -311,18 +364,69 @@ class Repo(repo.Repo):
 		self[b'HEAD'] = sha
 		index.write()
 
-		current_status = status(self)
+		current_status = southwark.status(self)
+
+		# Stage everything at once, so the index is only read and written once.
+		paths = [
+				os.path.normpath(filename) for filename in chain(
+						current_status.staged["add"],
+						current_status.staged["delete"],
+						current_status.staged["modify"],
+						)
+				]
 
-		for filename in chain(
-				current_status.staged["add"],
-				current_status.staged["delete"],
-				current_status.staged["modify"],
-				):
-			self.stage(os.path.normpath(filename.as_posix()))
+		if paths:
+			self.stage(paths)
 
 
 if PYPY36:  # pragma: no cover (not (PyPy and py36))
 
+	def _iter_ref_files(directory: str) -> Iterator[str]:
+		"""
+		Yield the path of each file below ``directory``, relative to it and with ``/`` as the separator.
+
+		This walks :class:`str` paths, as PyPy 3.6's :func:`os.scandir` doesn't support bytes paths on Windows.
+		Like :func:`os.walk`, unreadable directories are skipped and symlinks to directories aren't followed.
+
+		:param directory:
+		"""
+
+		stack = ['']
+
+		while stack:
+			reldir = stack.pop()
+
+			try:
+				scandir_it = os.scandir(os.path.join(directory, reldir))
+			except OSError:
+				continue
+
+			prefix = reldir + '/' if reldir else ''
+
+			with scandir_it:
+				for entry in scandir_it:
+					if not entry.is_dir():
+						yield prefix + entry.name
+					elif not entry.is_symlink():
+						stack.append(prefix + entry.name)
+
+	# Ref names made of slash-separated components of letters, digits, ``_``, ``-`` and single inner dots.
+	# Everything this matches is also accepted by dulwich.refs.check_ref_format.
+	_refname_component = rb"[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+)*"
+	_simple_refname = re.compile(_refname_component + rb"(?:/" + _refname_component + rb")+(?<!\.lock)")
+
+	def _check_ref_format(refname: bytes) -> bool:
+		"""
+		Check if a refname is correctly formatted.
+
+		Typical ref names are checked with a compiled regular expression,
+		falling back to :func:`dulwich.refs.check_ref_format` for anything unusual.
+
+		:param refname:
+		"""
+
+		return _simple_refname.fullmatch(refname) is not None or dulwich.refs.check_ref_format(refname)
+
 	class DiskRefsContainer(dulwich.refs.DiskRefsContainer):
 
 		@classmethod
@@ -335,20 +439,12 @@ if PYPY36:  # pragma: no cover (not (PyPy and py36))
 			if os.path.exists(self.refpath(b"HEAD")):
 				allkeys.add(b"HEAD")
 
-			path = self.refpath(b"")
-			refspath = self.refpath(b"refs")
-
-			for root, unused_dirs, files in os.walk(refspath.decode("UTF-8")):
-				dir = root[len(path):]  # noqa: A001  # pylint: disable=redefined-builtin
-
-				if os.path.sep != '/':
-					dir = dir.replace(os.path.sep, '/')  # noqa: A001  # pylint: disable=redefined-builtin
+			refspath = self.refpath(b"refs").decode("UTF-8")
 
-				for filename in files:
-					refname = '/'.join([dir, filename])
-
-					if dulwich.refs.check_ref_format(refname.encode("UTF-8")):
-						allkeys.add(refname.encode("UTF-8"))
+			for refname in _iter_ref_files(refspath):
+				refname_bytes = ("refs/" + refname).encode("UTF-8")
+				if _check_ref_format(refname_bytes):
+					allkeys.add(refname_bytes)
 
 			allkeys.update(self.get_packed_refs())
 			return allkeys
@@ -357,26 +453,16 @@ if PYPY36:  # pragma: no cover (not (PyPy and py36))
 			subkeys = set()
 
 			path = self.refpath(base).decode("UTF-8")
-			base = base.decode("UTF-8")
-
-			for root, unused_dirs, files in os.walk(path):
-				dir = root[len(path):]  # noqa: A001  # pylint: disable=redefined-builtin
-
-				if os.path.sep != '/':
-					dir = dir.replace(os.path.sep, '/')  # noqa: A001  # pylint: disable=redefined-builtin
-
-				dir = dir.strip('/')  # noqa: A001  # pylint: disable=redefined-builtin
 
-				for filename in files:
-					refname = '/'.join(([dir] if dir else []) + [filename])
-					# check_ref_format requires at least one /, so we prepend the
-					# base before calling it.
-					if dulwich.refs.check_ref_format((base + '/' + refname).encode("UTF-8")):
-						subkeys.add(refname)
+			for refname in _iter_ref_files(path):
+				# check_ref_format requires at least one /, so we prepend the
+				# base before calling it.
+				if _check_ref_format(base + b'/' + refname.encode("UTF-8")):
+					subkeys.add(refname)
 
 			for key in self.get_packed_refs():
 				if key.startswith(base):
-					subkeys.add(key[len(base):].strip('/'))
+					subkeys.add(key[len(base):].strip(b'/').decode("UTF-8"))
 
 			return subkeys
 
@@ -388,12 +474,22 @@ if PYPY36:  # pragma: no cover (not (PyPy and py36))
 				base = b""
 			else:
 				base = base.rstrip(b"/")
+
+			packed_refs = self.get_packed_refs()
+
 			for key in keys:
 				if isinstance(key, str):
 					key = key.encode("UTF-8")
 
+				refname = (base + b"/" + key).strip(b"/")
+
+				# Packed refs are never symbolic, but a loose ref of the same name takes precedence.
+				if refname in packed_refs and self.read_loose_ref(refname) is None:
+					ret[key] = packed_refs[refname]
+					continue
+
 				try:
-					ret[key] = self[(base + b"/" + key).strip(b"/")]
+					ret[key] = self[refname]
 				except KeyError:
 					continue  # Unable to resolve
 
@@ -3,6 +3,14 @@
 #  targit.py
 """
 Archive where the changes to the contents are recorded using `git <https://git-scm.com/>`_.
+
+If `isal <https://pypi.org/project/isal/>`_ is installed it is used to compress archives on multiple threads,
+and to decompress them, which is considerably faster than the standard library's :mod:`gzip` support.
+Similarly, if `rapidgzip <https://pypi.org/project/rapidgzip/>`_ is installed
+it is used to decompress large archives on multiple threads.
+Without :mod:`isal`, large archives are compressed with `pigz <https://zlib.net/pigz/>`_ if it is on the ``PATH``.
+
+.. versionchanged:: 0.10.0  Added support for :mod:`isal`, :mod:`rapidgzip` and ``pigz``.
 """
 #
 #  Copyright © 2020,2022 Dominic Davis-Foster <dominic@davis-foster.co.uk>
@@ -27,15 +35,19 @@ Archive where the changes to the contents are recorded using `git <https://git-s
 #
 
 # stdlib
-import atexit
-import datetime
 import getpass
+import inspect
 import os
 import re
+import shutil
 import socket
+import subprocess
 import tarfile
+import threading
 import time
-from typing import Iterator, NamedTuple, Optional
+import weakref
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, NamedTuple, Optional, Tuple
 
 # 3rd party
 from domdf_python_tools.doctools import prettify_docstrings
@@ -46,8 +58,20 @@ from dulwich.repo import Repo
 from filelock import FileLock, Timeout
 from typing_extensions import Literal
 
+try:  # pragma: no cover
+	# 3rd party
+	from isal import igzip, igzip_threaded  # type: ignore
+except ImportError:  # pragma: no cover
+	igzip = igzip_threaded = None
+
+try:  # pragma: no cover
+	# 3rd party
+	import rapidgzip  # type: ignore
+except ImportError:  # pragma: no cover
+	rapidgzip = None
+
 # this package
-from southwark import StagedDict, status
+from southwark import StagedDict, get_tree_changes, status
 
 __all__ = [
 		"BadArchiveError",
@@ -58,6 +82,68 @@ __all__ = [
 		"SaveState",
 		]
 
+# Copy member data in 4 MiB chunks rather than tarfile's default of 16 KiB.
+# The argument is only accepted by newer versions of Python.
+if "copybufsize" in inspect.signature(tarfile.TarFile).parameters:  # pragma: no cover (<py38)
+	_tarfile_kwargs: Dict[str, Any] = {"copybufsize": 4 * 1024 * 1024}
+else:  # pragma: no cover (py38+)
+	_tarfile_kwargs = {}
+
+# The size of the buffer used when writing archives.
+_write_buffer_size = 4 * 1024 * 1024
+
+# Files modified within this many nanoseconds may still change without their mtime changing,
+# as some filesystems (e.g. FAT) only store timestamps to the nearest 2 seconds.
+_racy_window_ns = 2_000_000_000
+
+# Matches the ``user@device`` email in a commit's author, which is set by TarGit.save.
+_author_re = re.compile(rb"[^<]*\s<([^@>]*)@([^>]*)>")
+
+# Used to compress archives on multiple cores when isal is not installed.
+_pigz = shutil.which("pigz")
+
+# Smaller archives are compressed in-process, as they take less time to compress than pigz takes to start.
+_pigz_threshold = 1024 * 1024
+
+# Archives smaller than this (in bytes) are decompressed faster than rapidgzip can start its threads.
+_parallel_read_threshold = 8 * 1024 * 1024
+
+# Matches unsafe member names, in a string of names separated by NUL:
+# absolute paths, paths in the user's home directory, and path traversal.
+# Backslashes are treated as separators on every platform.
+_unsafe_names_pattern = r"(?:^|\0)[/\\~]|(?:^|[\0/\\])\.\.(?:[\0/\\]|$)"
+
+if os.name == "nt":  # pragma: no cover (not Windows)
+	# Drive letters.
+	_unsafe_names_pattern += r"|(?:^|\0)[^\0]:"
+
+_unsafe_names_re = re.compile(_unsafe_names_pattern)
+
+
+class _ProcessLock:
+	# A threading.Lock which can be weakly referenced,
+	# so it is discarded once no TarGit in the process is using or waiting for it.
+
+	__slots__ = ("_lock", "__weakref__")
+
+	def __init__(self) -> None:
+		self._lock = threading.Lock()
+
+	def acquire(self, timeout: float = -1) -> bool:
+		# threading.Lock only accepts -1 to mean "wait indefinitely".
+		if timeout < 0:
+			timeout = -1
+
+		return self._lock.acquire(timeout=timeout)
+
+	def release(self) -> None:
+		self._lock.release()
+
+
+# Locks for the archives opened for writing by this process, keyed by absolute filename.
+_process_locks: "weakref.WeakValueDictionary[str, _ProcessLock]" = weakref.WeakValueDictionary()
+_process_locks_lock = threading.Lock()
+
 Modes = Literal["r", "w", "a"]
 """
 Valid modes for opening :class:`~.TarGit` archives in
@@ -129,14 +215,193 @@ def check_archive_paths(archive: tarfile.TarFile) -> bool:
 	:param archive:
 	"""  # noqa: D400
 
-	for member_name in archive.getnames():
-		member_name_p = PathPlus(member_name)
-		if member_name_p.is_absolute() or ".." in member_name_p.parts or member_name.startswith('~'):
-			raise BadArchiveError
+	# Member names can't contain NUL, so the whole list can be searched in one go.
+	if _unsafe_names_re.search('\0'.join(archive.getnames())):
+		raise BadArchiveError
 
 	return True
 
 
+def _is_safe_member_name(member_name: str) -> bool:
+	"""
+	Returns whether the given archive member name is safe to extract.
+
+	See :func:`~.check_archive_paths` for the names which are rejected.
+
+	:param member_name:
+	"""
+
+	return _unsafe_names_re.search(member_name) is None
+
+
+@contextmanager
+def _read_archive(filename: PathLike) -> Iterator[tarfile.TarFile]:
+	"""
+	Open the gzip-compressed tar archive ``filename`` for reading.
+
+	If :mod:`rapidgzip` is installed, archives larger than ``_parallel_read_threshold`` bytes
+	are decompressed with it on multiple threads.
+	Otherwise :mod:`isal` is used if it is installed, or :mod:`tarfile`'s own gzip support if not.
+
+	The archive must be read in a single forward pass.
+
+	:param filename:
+	"""
+
+	if rapidgzip is not None and os.path.getsize(filename) > _parallel_read_threshold:
+		# 0 uses all available cores.
+		with rapidgzip.open(os.fspath(filename), parallelization=0) as gz:
+			with tarfile.open(mode="r:", format=tarfile.PAX_FORMAT, fileobj=gz, **_tarfile_kwargs) as tf:
+				yield tf
+		return
+
+	if igzip is not None:
+		# Only forward seeks are safe, as isal's reader can't seek backwards through archives
+		# with multiple gzip members, such as those written by its threaded writer.
+		with igzip.open(filename, "rb") as gz:
+			with tarfile.open(mode="r:", format=tarfile.PAX_FORMAT, fileobj=gz, **_tarfile_kwargs) as tf:
+				yield tf
+		return
+
+	with tarfile.open(filename, mode="r:gz", format=tarfile.PAX_FORMAT, **_tarfile_kwargs) as tf:
+		yield tf
+
+
+@contextmanager
+def _write_archive(filename: PathLike, fp: IO[bytes], source: PathLike) -> Iterator[tarfile.TarFile]:
+	"""
+	Open a gzip-compressed tar archive for writing to ``fp``.
+
+	If :mod:`isal` is installed the archive is compressed with ISA-L on multiple threads.
+	Otherwise, if the ``pigz`` command is available and the archive is larger than ``_pigz_threshold`` bytes,
+	it is piped through ``pigz`` to compress it on multiple cores at the same level as :mod:`tarfile` uses.
+	Failing that :mod:`tarfile`'s own gzip support is used.
+	Either way the result is a standard ``.tar.gz`` file.
+
+	:param filename: The filename of the archive.
+	:param fp: The open archive file.
+	:param source: The directory being archived.
+	"""
+
+	if igzip_threaded is not None:
+		with igzip_threaded.open(fp, "wb", threads=os.cpu_count() or 1) as gz:
+			# The threaded writer can't seek, so the archive is written as a stream.
+			with tarfile.open(mode="w|", format=tarfile.PAX_FORMAT, fileobj=gz, **_tarfile_kwargs) as tf:
+				yield tf
+	elif _pigz is not None and _is_larger_than(source, _pigz_threshold):
+		yield from _write_archive_pigz(_pigz, fp)
+	else:
+		with tarfile.open(
+				filename,
+				mode="w:gz",
+				format=tarfile.PAX_FORMAT,
+				fileobj=fp,
+				**_tarfile_kwargs,
+				) as tf:
+			yield tf
+
+
+def _write_archive_pigz(pigz: str, fp: IO[bytes]) -> Iterator[tarfile.TarFile]:
+	# pigz writes the compressed stream straight to the archive file.
+	fp.flush()
+	# -9 matches the compression level used by tarfile.
+	process = subprocess.Popen([pigz, "-c", "-9"], stdin=subprocess.PIPE, stdout=fp)
+	stdin: IO[bytes] = process.stdin  # type: ignore
+
+	try:
+		with tarfile.open(mode="w|", format=tarfile.PAX_FORMAT, fileobj=stdin, **_tarfile_kwargs) as tf:
+			yield tf
+	finally:
+		stdin.close()
+		returncode = process.wait()
+
+	if returncode:
+		raise OSError(f"{pigz!r} exited with code {returncode}")
+
+
+def _cleanup(
+		tmpdir: TemporaryPathPlus,
+		lock: Optional[FileLock],
+		process_lock: Optional[_ProcessLock],
+		) -> None:
+	tmpdir.cleanup()
+	if lock is not None:
+		lock.release()
+	if process_lock is not None:
+		process_lock.release()
+
+
+def _get_process_lock(filename: PathPlus) -> _ProcessLock:
+	key = str(filename.resolve())
+
+	with _process_locks_lock:
+		process_lock = _process_locks.get(key)
+		if process_lock is None:
+			process_lock = _process_locks[key] = _ProcessLock()
+		return process_lock
+
+
+def _is_larger_than(path: PathLike, size: int) -> bool:
+	"""
+	Returns whether the files in the directory ``path`` total more than ``size`` bytes.
+
+	The directory is only walked until that size is reached.
+
+	:param path:
+	:param size:
+	"""
+
+	total = 0
+	stack = [os.fspath(path)]
+
+	while stack:
+		with os.scandir(stack.pop()) as scandir_it:
+			for entry in scandir_it:
+				if entry.is_dir(follow_symlinks=False):
+					stack.append(entry.path)
+				else:
+					total += entry.stat(follow_symlinks=False).st_size
+					if total > size:
+						return True
+
+	return False
+
+
+def _get_tree_signature(path: PathLike) -> Tuple[Tuple[str, int, int], ...]:
+	"""
+	Returns a signature of the files in the working tree at ``path``, which changes whenever a file is changed.
+
+	This consists of the path, mtime and size of each file, excluding the ``.git`` directory.
+
+	:param path:
+	"""
+
+	signature = []
+	stack = [os.fspath(path)]
+
+	while stack:
+		with os.scandir(stack.pop()) as scandir_it:
+			for entry in scandir_it:
+				if entry.is_dir(follow_symlinks=False):
+					if entry.name != ".git":
+						stack.append(entry.path)
+				else:
+					st = entry.stat(follow_symlinks=False)
+					signature.append((entry.path, st.st_mtime_ns, st.st_size))
+
+	return tuple(signature)
+
+
+def _copy_staged(staged: StagedDict) -> StagedDict:
+	"""
+	Returns a copy of ``staged``, so the cached status can't be modified by the caller.
+
+	:param staged:
+	"""
+
+	return {"add": list(staged["add"]), "delete": list(staged["delete"]), "modify": list(staged["modify"])}
+
+
 class BadArchiveError(IOError):
 	"""
 	Exception to indicate an archive contains files utilising path traversal.
@@ -153,56 +418,82 @@ class TarGit(os.PathLike):
 
 	:param filename: The filename of the archive.
 	:param mode: The mode to open the file in.
+	:param lock_timeout: The number of seconds to wait for the archive to be unlocked
+		when opening it in write or append mode. A negative value waits indefinitely.
 
 	:raises FileNotFoundError: If the file is opened in read or append mode, but it does not exist.
 	:raises FileExistsError: If the file is opened in write mode, but it already exists.
 	:raises ValueError: If an unknown value for ``mode`` is given.
+	:raises OSError: If the archive is still locked after ``lock_timeout`` seconds.
+
+	.. versionchanged:: 0.10.0
+
+		* Added the ``lock_timeout`` argument.
+		* In read mode the archive is only extracted when its contents are first accessed,
+		  so :exc:`~.BadArchiveError` is raised at that point rather than when the archive is opened.
 	"""  # noqa: D400
 
 	__mode: Modes
 	__repo: Repo
 	__lock: Optional[FileLock]
+	__process_lock: Optional[_ProcessLock]
+	__extracted: bool
+	__username: bytes
 
-	def __init__(self, filename: PathLike, mode: Modes = 'r'):
+	def __init__(self, filename: PathLike, mode: Modes = 'r', lock_timeout: float = 1):
 		self.filename = PathPlus(filename)
 		self.__closed: bool = True
+		self.__status_cache: Optional[Tuple[Tuple[Tuple[str, int, int], ...], StagedDict]] = None
 
-		self.__tmpdir: TemporaryPathPlus = TemporaryPathPlus()
-		self.__tmpdir_p = self.__tmpdir.name
-		atexit.register(self.__exit_handler)
+		self.__lock = None
+		self.__process_lock = None
 
 		if mode in {'w', 'a'}:
+			# The identity used for every commit made by this TarGit.
+			login = getpass.getuser()
+			self.__username = f"{login} <{login}@{socket.gethostname()}>".encode("UTF-8")
+
+			# Other TarGits for the same file in this process are waited for without touching the filesystem.
+			process_lock = _get_process_lock(self.filename)
+			if not process_lock.acquire(timeout=lock_timeout):
+				raise OSError(f"Unable to acquire a lock for the file '{self.filename!s}'")
+			self.__process_lock = process_lock
+
 			lock_file = str(self.filename.with_suffix(self.filename.suffix + ".lock"))
-			self.__lock = FileLock(lock_file, timeout=1)
+			self.__lock = FileLock(lock_file, timeout=lock_timeout)
 			try:
 				self.__lock.acquire()
 			except Timeout:
+				self.__process_lock.release()
+				self.__process_lock = None
 				raise OSError(f"Unable to acquire a lock for the file '{self.filename!s}'")
-		else:
-			self.__lock = None
+
+		self.__tmpdir: TemporaryPathPlus = TemporaryPathPlus()
+		self.__tmpdir_p = self.__tmpdir.name
+
+		# Unlike an atexit handler this doesn't keep the TarGit alive,
+		# so it is cleaned up when garbage collected as well as when the interpreter exits.
+		self.__finalizer = weakref.finalize(self, _cleanup, self.__tmpdir, self.__lock, self.__process_lock)
 
 		if mode in {'r', 'a'}:
 			if not self.exists():
 				raise FileNotFoundError(f"No such TarGit file '{self.filename!s}'")
 
-			with tarfile.open(
-					self.filename,
-					mode="r:gz",
-					format=tarfile.PAX_FORMAT,
-					) as tf:
-				check_archive_paths(tf)
-				tf.extractall(path=self.__tmpdir_p)
-
-			self.__repo = Repo(self.__tmpdir_p)
+			self.__extracted = False
 			self.__mode = mode
 			self.__closed = False
 
+			# A read-only archive is extracted the first time its contents are needed.
+			if mode == 'a':
+				self.__extract()
+
 		elif mode in {'w'}:
 			if self.exists():
 				raise FileExistsError(f"TarGit file '{self.filename!s}' already exists.")
 
 			# Initialise git repo in tmpdir
 			self.__repo = Repo.init(self.__tmpdir_p)
+			self.__extracted = True
 			self.__mode = mode
 			self.__closed = False
 			self.__do_commit(message="Empty initial commit.")
@@ -210,6 +501,22 @@ class TarGit(os.PathLike):
 		else:
 			raise ValueError(f"Unknown IO mode {mode!r}")
 
+	def __extract(self) -> None:
+		with _read_archive(self.filename) as tf:
+			# Check each member as it is extracted, in a single forward pass through the archive.
+			for member in tf:
+				if not _is_safe_member_name(member.name):
+					raise BadArchiveError
+
+				# The owner, mtime and permissions of the files in the private temporary directory don't matter,
+				# so skip the syscalls to restore them. The exception is the executable bit, which git tracks.
+				tf.extract(member, path=self.__tmpdir_p, set_attrs=False)
+				if member.isfile() and member.mode & 0o111:
+					os.chmod(os.path.join(self.__tmpdir_p, member.name), member.mode & 0o777)
+
+		self.__repo = Repo(self.__tmpdir_p)
+		self.__extracted = True
+
 	def save(self) -> bool:
 		"""
 		Saves the contents of the archive.
@@ -227,28 +534,17 @@ class TarGit(os.PathLike):
 			raise OSError("Cannot write to TarGit file opened in read-only mode.")
 
 		current_status = self.status()
+		added, deleted, modified = current_status["add"], current_status["delete"], current_status["modify"]
 
-		if any([
-				current_status["add"] != [],
-				current_status["delete"] != [],
-				current_status["modify"] != [],
-				]):
+		if added or deleted or modified:
 			# There are changes to commit
-			message = "; ".join([
-					f"{len(current_status['add'])} added",
-					f"{len(current_status['delete'])} deleted",
-					f"{len(current_status['modify'])} modified",
-					])
+			message = f"{len(added)} added; {len(deleted)} deleted; {len(modified)} modified"
 
 			self.__do_commit(message)
 
-			with self.filename.open("wb", buffering=False) as fp:
-				with tarfile.open(
-						self.filename,
-						mode="w:gz",
-						format=tarfile.PAX_FORMAT,
-						fileobj=fp,
-						) as tf:
+			# The gzip stream writes many small chunks, so buffer them rather than writing each one to disk.
+			with self.filename.open("wb", buffering=_write_buffer_size) as fp:
+				with _write_archive(self.filename, fp, self.__tmpdir_p) as tf:
 					tf.add(str(self.__tmpdir_p), arcname='')
 
 				fp.flush()
@@ -271,12 +567,28 @@ class TarGit(os.PathLike):
 		elif self.__mode not in {'w', 'a'}:
 			return {"add": [], "delete": [], "modify": []}
 
-		current_status = status(self.__tmpdir_p)
+		# Nothing can have changed if none of the files have been touched since the last call.
+		signature = _get_tree_signature(self.__tmpdir_p)
+		if self.__status_cache is not None and self.__status_cache[0] == signature:
+			return _copy_staged(self.__status_cache[1])
+
+		current_status = status(self.__repo)
+
+		to_stage = [*current_status.unstaged, *current_status.untracked]
+		if to_stage:
+			self.__repo.stage(to_stage)
 
-		for file in (*current_status.unstaged, *current_status.untracked):
-			self.__repo.stage(str(file))
+		# Once everything is staged the working tree matches the index,
+		# so only the index needs comparing to HEAD; there is no need to walk the tree again.
+		staged = get_tree_changes(self.__repo)
 
-		return status(self.__tmpdir_p).staged
+		# A file changed within the filesystem's timestamp resolution of being recorded could change again
+		# without its mtime changing, so the result is only cached once all the files are older than that.
+		newest_mtime = max((mtime for _, mtime, _ in signature), default=0)
+		if newest_mtime < time.time() * 1e9 - _racy_window_ns:
+			self.__status_cache = (signature, staged)
+
+		return _copy_staged(staged)
 
 	def __do_commit(self, message: str) -> None:
 		if self.closed:
@@ -284,16 +596,18 @@ class TarGit(os.PathLike):
 		elif self.__mode not in {'w', 'a'}:
 			raise OSError("Cannot write to TarGit file opened in read-only mode.")
 
-		login = getpass.getuser()
-		username = f"{login} <{login}@{socket.gethostname()}>"
-		current_time = datetime.datetime.now(datetime.timezone.utc).astimezone()
-		current_timezone = current_time.tzinfo.utcoffset(None).total_seconds()  # type: ignore
+		# The committed changes are no longer staged.
+		self.__status_cache = None
+
+		# The UTC offset is looked up for each commit as it changes with daylight saving time.
+		current_time = time.time()
+		current_timezone = time.localtime(current_time).tm_gmtoff
 
 		self.__repo.do_commit(
 				message=message.encode("UTF-8"),
-				committer=username.encode("UTF-8"),
-				author=username.encode("UTF-8"),
-				commit_timestamp=current_time.timestamp(),
+				committer=self.__username,
+				author=self.__username,
+				commit_timestamp=current_time,
 				commit_timezone=current_timezone,
 				)
 
@@ -309,14 +623,8 @@ class TarGit(os.PathLike):
 		Closes the :class:`~.TarGit` archive.
 		"""
 
-		self.__exit_handler()
-		atexit.unregister(self.__exit_handler)
-
-	def __exit_handler(self) -> None:
-		if self.__tmpdir is not None:
-			self.__tmpdir.cleanup()
-		if self.__lock is not None:
-			self.__lock.release()
+		self.__finalizer()
+		self.__process_lock = None
 		self.__closed = True
 
 	@property
@@ -346,10 +654,10 @@ class TarGit(os.PathLike):
 		:param filename:
 		"""  # noqa: D400
 
-		return self.__tmpdir_p / filename
+		if not self.closed and not self.__extracted:
+			self.__extract()
 
-	def __del__(self) -> None:
-		self.close()
+		return self.__tmpdir_p / filename
 
 	def __repr__(self) -> str:
 		"""
@@ -380,13 +688,15 @@ class TarGit(os.PathLike):
 		"""
 		if self.closed:
 			raise OSError("IO operation on closed TarGit file.")
+		elif not self.__extracted:
+			self.__extract()
 
 		for entry in self.__repo.get_walker():
 			# TODO: changed files
 
-			author_m = re.match(r".*?\s+<(.*?)@(.*?)>", entry.commit.author.decode("UTF-8"))
+			author_m = _author_re.match(entry.commit.author)
 			if author_m:
-				user, device = author_m.groups()
+				user, device = (group.decode("UTF-8") for group in author_m.groups())
 			else:
 				user, device = '', ''
 
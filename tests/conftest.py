@@ -1,6 +1,10 @@
 # stdlib
+import os
 import pathlib
 import shutil
+import sys
+import tempfile
+from typing import Iterator
 
 # 3rd party
 import pytest
@@ -8,6 +12,43 @@ from domdf_python_tools.paths import PathPlus
 
 pytest_plugins = ("coincidence", )
 
+_shm = "/dev/shm"
+
+# The free space needed on /dev/shm before it is used in place of the usual temporary directory.
+_shm_min_free = 512 * 1024 * 1024
+
+
+def pytest_addoption(parser) -> None:
+	parser.addoption(
+			"--online",
+			action="store_true",
+			default=False,
+			help="Run tests with files downloaded from the internet, rather than generated ones.",
+			)
+
+
+def _use_shm() -> bool:
+	if sys.platform != "linux" or not os.path.isdir(_shm) or not os.access(_shm, os.W_OK):
+		return False
+
+	try:
+		return shutil.disk_usage(_shm).free >= _shm_min_free
+	except OSError:
+		return False
+
+
+@pytest.fixture()
+def tmp_pathplus(request) -> Iterator[PathPlus]:
+	# Overrides coincidence's fixture. On Linux the directory is created on tmpfs where possible,
+	# so the archives and repositories written by the tests never touch the disk.
+	# Small or missing tmpfs mounts (such as in containers) fall back to pytest's tmp_path.
+	if _use_shm():
+		tmpdir = PathPlus(tempfile.mkdtemp(prefix="southwark-", dir=_shm))
+		yield tmpdir
+		shutil.rmtree(tmpdir, ignore_errors=True)
+	else:
+		yield PathPlus(request.getfixturevalue("tmp_path"))
+
 
 @pytest.fixture()
 def tmp_repo(tmp_pathplus: PathPlus) -> PathPlus:
@@ -1,14 +1,17 @@
 # stdlib
 import platform
+from io import StringIO
 
 # 3rd party
 import pytest
 from coincidence.regressions import AdvancedFileRegressionFixture
+from consolekit.terminal_colours import strip_ansi
 from domdf_python_tools.compat import PYPY36
 from domdf_python_tools.paths import PathPlus
 
 # this package
 from southwark.log import Log
+from southwark.repo import Repo
 
 _err_msg = "Dulwich causes 'TypeError: os.scandir() doesn't support bytes path on Windows, use Unicode instead'"
 pypy_windows_dulwich = pytest.mark.skipif(
@@ -22,6 +25,13 @@ def test_log(tmp_repo: PathPlus, advanced_file_regression: AdvancedFileRegressio
 	advanced_file_regression.check(Log(tmp_repo).log())
 
 
+@pypy_windows_dulwich
+def test_log_no_colour(tmp_repo: PathPlus):
+	log = Log(tmp_repo)
+	assert log.log(colour=False) == strip_ansi(log.log())
+	assert '\x1b' not in log.log(colour=False)
+
+
 @pypy_windows_dulwich
 def test_log_reverse(tmp_repo: PathPlus, advanced_file_regression: AdvancedFileRegressionFixture):
 	advanced_file_regression.check(Log(tmp_repo).log(reverse=True))
@@ -33,3 +43,48 @@ def test_log_from_tag(tmp_repo: PathPlus, advanced_file_regression: AdvancedFile
 
 	with pytest.raises(ValueError, match="No such tag 'v5.0.0'"):
 		Log(tmp_repo).log(from_tag="v5.0.0")
+
+
+@pypy_windows_dulwich
+def test_log_branches(tmp_repo: PathPlus):
+	repo = Repo(tmp_repo)
+	head = repo.refs[b"HEAD"]
+	parent = repo[head].parents[0]
+
+	repo.refs[b"refs/heads/feature"] = head
+	repo.refs[b"refs/heads/old"] = parent
+	repo.refs[b"refs/remotes/origin/master"] = head
+	repo.refs[b"refs/remotes/origin/old"] = parent
+
+	log = Log(repo)
+	assert log.local_branches == {
+			"master": head.decode("ascii"),
+			"feature": head.decode("ascii"),
+			"old": parent.decode("ascii"),
+			}
+	assert log.remote_branches == {"origin/master": head.decode("ascii"), "origin/old": parent.decode("ascii")}
+
+	headers = [line for line in log.log(max_entries=2, colour=False).splitlines() if line.startswith("commit: ")]
+	assert headers == [
+			f"commit: {head.decode('ascii')} (HEAD -> master, tag: v2.0.1, origin/master, feature)",
+			f"commit: {parent.decode('ascii')} (tag: v2.0.0, origin/old)",
+			]
+
+
+@pypy_windows_dulwich
+@pytest.mark.parametrize(
+		"kwargs",
+		[
+				pytest.param({}, id="default"),
+				pytest.param({"reverse": True}, id="reverse"),
+				pytest.param({"max_entries": 2}, id="max_entries"),
+				pytest.param({"from_tag": "v2.0.0"}, id="from_tag"),
+				pytest.param({"from_tag": "v2.0.0", "reverse": True}, id="from_tag_reverse"),
+				pytest.param({"colour": False}, id="no_colour"),
+				]
+		)
+def test_stream_log(tmp_repo: PathPlus, kwargs):
+	log = Log(tmp_repo)
+	out = StringIO()
+	log.stream_log(out, **kwargs)
+	assert out.getvalue() == log.log(**kwargs)
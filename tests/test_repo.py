@@ -1,5 +1,6 @@
 # 3rd party
 from coincidence.regressions import AdvancedDataRegressionFixture
+from coincidence.selectors import not_windows
 from domdf_python_tools.paths import PathPlus
 
 # this package
@@ -54,3 +55,46 @@ def test_reset_to(tmp_pathplus: PathPlus):
 	for entry in repo.get_walker():
 		assert entry.commit.id == b"b2a09de2c93fd8dae057f7f8d178ed3abeca6efe"
 		break
+
+
+def test_do_commit_identity(tmp_pathplus: PathPlus, monkeypatch) -> None:
+	monkeypatch.delenv("GIT_COMMITTER_NAME", raising=False)
+	monkeypatch.delenv("GIT_COMMITTER_EMAIL", raising=False)
+	monkeypatch.setenv("GIT_AUTHOR_NAME", "Guido")
+	monkeypatch.setenv("GIT_AUTHOR_EMAIL", "guido@python.org")
+
+	repo = Repo.init(tmp_pathplus)
+	config = repo.get_config()
+	config.set(("user", ), "name", b"Dominic")
+	config.set(("user", ), "email", b"<dominic@example.com>")
+	config.write_to_path()
+
+	commit = repo[repo.do_commit(b"Initial commit")]
+	assert commit.committer == b"Dominic <dominic@example.com>"
+	assert commit.author == b"Guido <guido@python.org>"
+
+
+@not_windows(reason="Symlinks require extra privileges on Windows")
+def test_reset_to_type_change(tmp_pathplus: PathPlus) -> None:
+	repo = Repo.init(tmp_pathplus)
+	(tmp_pathplus / "target.txt").write_clean("Hello World")
+	(tmp_pathplus / "link").symlink_to("target.txt")
+	(tmp_pathplus / "removed.txt").write_clean("Goodbye")
+	repo.stage(["target.txt", "link", "removed.txt"])
+	first = repo.do_commit(b"Initial commit", committer=b"Joe <joe@example.com>")
+
+	# The symlink becomes a regular file, and removed.txt is deleted.
+	(tmp_pathplus / "link").unlink()
+	(tmp_pathplus / "link").write_clean("Not a link")
+	(tmp_pathplus / "removed.txt").unlink()
+	(tmp_pathplus / "added.txt").write_clean("New")
+	repo.stage(["link", "removed.txt", "added.txt"])
+	repo.do_commit(b"Second commit", committer=b"Joe <joe@example.com>")
+
+	repo.reset_to(first)
+
+	assert (tmp_pathplus / "link").is_symlink()
+	assert (tmp_pathplus / "link").read_text() == "Hello World\n"
+	assert (tmp_pathplus / "removed.txt").is_file()
+	assert not (tmp_pathplus / "added.txt").exists()
+	assert status(repo).staged == {"add": [], "delete": [], "modify": []}
@@ -1,3 +1,8 @@
+# stdlib
+import os
+import shutil
+import time
+
 # 3rd party
 from coincidence.regressions import AdvancedDataRegressionFixture
 from coincidence.selectors import not_windows
@@ -5,7 +10,17 @@ from domdf_python_tools.paths import PathPlus
 from pytest_git import GitRepo  # type: ignore
 
 # this package
-from southwark import assert_clean, check_git_status, get_tags
+import southwark
+from southwark import (
+		GitStatus,
+		assert_clean,
+		check_git_status,
+		format_git_status,
+		get_tags,
+		invalidate_ignore_cache,
+		status
+		)
+from southwark.repo import Repo
 
 
 def test_get_tags(tmp_repo: PathPlus, advanced_data_regression: AdvancedDataRegressionFixture):
@@ -61,6 +76,7 @@ def test_assert_clean(git_repo: GitRepo, capsys, monkeypatch):
 
 	git_repo.api.index.commit("Initial commit")
 	assert assert_clean(repo_path)
+	assert assert_clean(Repo(repo_path))
 
 	(repo_path / "file.txt").write_text("Hello Again")
 	assert not assert_clean(repo_path)
@@ -68,3 +84,220 @@ def test_assert_clean(git_repo: GitRepo, capsys, monkeypatch):
 			"Git working directory is not clean:",
 			"  M file.txt",
 			]
+
+
+def test_status_ignored(git_repo: GitRepo):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / ".gitignore").write_text("build/\n*.log\n")
+	(repo_path / "build").mkdir()
+	(repo_path / "build" / "output.txt").write_text("Hello World")
+	(repo_path / "debug.log").write_text("Hello World")
+	(repo_path / "file.txt").write_text("Hello World")
+
+	assert sorted(status(repo_path).untracked) == [".gitignore", "file.txt"]
+
+
+def test_status_unstaged(git_repo: GitRepo):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / ".gitignore").write_text("build/\n")
+	(repo_path / "build").mkdir()
+	(repo_path / "build" / "output.txt").write_text("Hello World")
+	(repo_path / "deleted.txt").write_text("Hello World")
+	(repo_path / "modified.txt").write_text("Hello World")
+	(repo_path / "unchanged.txt").write_text("Hello World")
+	git_repo.run("git add .gitignore deleted.txt modified.txt unchanged.txt")
+	git_repo.run("git add -f build/output.txt")
+	git_repo.api.index.commit("Initial commit")
+
+	(repo_path / "build" / "output.txt").write_text("Hello Again")
+	(repo_path / "deleted.txt").unlink()
+	(repo_path / "modified.txt").write_text("Hello Again")
+
+	current_status = status(repo_path)
+	assert current_status.unstaged == ["build/output.txt", "deleted.txt", "modified.txt"]
+	assert current_status.untracked == []
+
+
+def test_get_tags_cache(tmp_repo: PathPlus):
+	tags = get_tags(tmp_repo)
+	assert get_tags(tmp_repo) == tags
+
+	repo = Repo(tmp_repo)
+	identity = b"Guido <guido@python.org>"
+	first = repo.do_commit(b"First", committer=identity, author=identity)
+	second = repo.do_commit(b"Second", committer=identity, author=identity)
+	repo.refs[b"refs/tags/v9.9.9"] = first
+	repo.refs[b"refs/tags/nested/v9.9.8"] = second
+
+	expected = {**tags, first.decode("UTF-8"): "v9.9.9", second.decode("UTF-8"): "nested/v9.9.8"}
+	assert get_tags(tmp_repo) == expected
+
+	del repo.refs[b"refs/tags/nested/v9.9.8"]
+	del expected[second.decode("UTF-8")]
+	assert get_tags(tmp_repo) == expected
+
+
+def test_get_tags_cache_racy(tmp_repo: PathPlus):
+	commondir = os.path.abspath(tmp_repo / ".git")
+	southwark._tags_cache.pop(commondir, None)
+
+	# The refs were only just written, so a tag could still change without their mtimes changing.
+	tags = get_tags(tmp_repo)
+	assert commondir not in southwark._tags_cache
+
+	an_hour_ago = time.time() - 3600
+	for path in [tmp_repo / ".git" / "packed-refs", *(tmp_repo / ".git" / "refs" / "tags").rglob('*')]:
+		if path.exists():
+			os.utime(path, (an_hour_ago, an_hour_ago))
+	os.utime(tmp_repo / ".git" / "refs" / "tags", (an_hour_ago, an_hour_ago))
+
+	assert get_tags(tmp_repo) == tags
+	assert commondir in southwark._tags_cache
+	assert get_tags(tmp_repo) == tags
+
+
+@not_windows(reason="Symlinks require elevated privileges on Windows")
+def test_status_symlinks(git_repo: GitRepo, tmp_pathplus: PathPlus):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / "file.txt").write_text("Hello World")
+	(repo_path / "directory").mkdir()
+	(repo_path / "inside.txt").symlink_to(repo_path / "file.txt")
+	(repo_path / "inside_dir").symlink_to(repo_path / "directory")
+	(tmp_pathplus / "outside.txt").write_text("Hello World")
+	(repo_path / "outside.txt").symlink_to(tmp_pathplus / "outside.txt")
+
+	assert sorted(status(repo_path).untracked) == ["file.txt", "inside.txt", "inside_dir"]
+
+
+def test_assert_clean_allow_config(git_repo: GitRepo, capsys):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / "repo_helper.yml").write_text("Hello World")
+	(repo_path / "file.txt").write_text("Hello World")
+
+	git_repo.run("git add repo_helper.yml")
+	assert assert_clean(repo_path, allow_config=["repo_helper.yml"])
+
+	git_repo.run("git add file.txt")
+	assert not assert_clean(repo_path, allow_config=["repo_helper.yml"])
+	assert capsys.readouterr().err.splitlines() == [
+			"Git working directory is not clean:",
+			"  A file.txt",
+			"  A repo_helper.yml",
+			]
+
+
+def test_check_git_status_staged_and_unstaged(git_repo: GitRepo):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / "file.txt").write_text("Hello World")
+	(repo_path / "directory").mkdir()
+	(repo_path / "directory" / "file.txt").write_text("Hello World")
+	git_repo.run("git add file.txt directory/file.txt")
+	git_repo.api.index.commit("Initial commit")
+
+	(repo_path / "file.txt").write_text("Hello Again")
+	git_repo.run("git add file.txt")
+	(repo_path / "file.txt").write_text("Hello Everyone")
+	(repo_path / "directory" / "file.txt").write_text("Hello Again")
+
+	clean, files = check_git_status(repo_path)
+	assert not clean
+	assert files == ["M  directory/file.txt", "MM file.txt"]
+
+
+def test_format_git_status():
+	assert list(format_git_status(GitStatus({"add": [], "delete": [], "modify": []}, [], []))) == []
+
+	staged = {"add": ["b.txt"], "delete": ["a.txt"], "modify": []}
+	assert list(format_git_status(GitStatus(staged, ["c.txt"], []))) == [  # type: ignore
+		"D a.txt",
+		"A b.txt",
+		"M c.txt",
+		]
+
+	# A file which is both staged and unstaged widens the column for every line.
+	staged = {"add": ["b.txt"], "delete": ["a.txt"], "modify": ["c.txt"]}
+	assert list(format_git_status(GitStatus(staged, ["b.txt", "c.txt", "d.txt"], []))) == [  # type: ignore
+		"D  a.txt",
+		"AM b.txt",
+		"MM c.txt",
+		"M  d.txt",
+		]
+
+
+def test_status_parallel_walk(git_repo: GitRepo, monkeypatch):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / ".gitignore").write_text("build/\n")
+
+	for directory in ("build", "a", "a/b", "c", "c/d/e"):
+		(repo_path / directory).mkdir(parents=True, exist_ok=True)
+		for idx in range(5):
+			(repo_path / directory / f"file_{idx}.txt").write_text("Hello World")
+
+	serial = status(repo_path)
+
+	monkeypatch.setattr(southwark, "_parallel_walk_threshold", 0)
+	monkeypatch.setattr(southwark, "_max_walk_workers", 4)
+	parallel = status(repo_path)
+
+	assert parallel == serial
+	assert len(parallel.untracked) == 21
+	assert not any(path.startswith("build/") for path in parallel.untracked)
+
+
+def test_status_ignore_cache(git_repo: GitRepo):
+	repo_path = PathPlus(git_repo.workspace)
+	(repo_path / "directory").mkdir()
+	(repo_path / "directory" / "file.txt").write_text("Hello World")
+	(repo_path / "directory" / "file.log").write_text("Hello World")
+
+	invalidate_ignore_cache()
+	assert sorted(status(repo_path).untracked) == ["directory/file.log", "directory/file.txt"]
+
+	# A new .gitignore in a directory which has already been walked.
+	(repo_path / "directory" / ".gitignore").write_text("*.log\n")
+	assert sorted(status(repo_path).untracked) == ["directory/.gitignore", "directory/file.txt"]
+
+	# A modified .gitignore.
+	(repo_path / "directory" / ".gitignore").write_text("*.log\n*.txt\n")
+	assert sorted(status(repo_path).untracked) == ["directory/.gitignore"]
+
+
+def test_status_ignore_cache_racy(tmp_pathplus: PathPlus):
+	invalidate_ignore_cache()
+	Repo.init(tmp_pathplus, mkdir=False)
+	(tmp_pathplus / ".gitignore").write_text("*.log\n")
+	(tmp_pathplus / "file.log").write_text("Hello World")
+
+	# The ignore files were only just written, so a change could still go unnoticed.
+	assert status(tmp_pathplus).untracked == [".gitignore"]
+	assert str(tmp_pathplus) not in southwark._ignore_cache
+
+	an_hour_ago = time.time() - 3600
+	git_dir = tmp_pathplus / ".git"
+	for path in [tmp_pathplus / ".gitignore", git_dir / "config", git_dir / "info" / "exclude"]:
+		if path.exists():
+			os.utime(path, (an_hour_ago, an_hour_ago))
+
+	assert status(tmp_pathplus).untracked == [".gitignore"]
+	assert str(tmp_pathplus) in southwark._ignore_cache
+	assert status(tmp_pathplus).untracked == [".gitignore"]
+
+
+def test_status_ignore_cache_bounded(tmp_pathplus: PathPlus, monkeypatch):
+	# The repositories are all new, so would otherwise never be cached.
+	monkeypatch.setattr(southwark, "_racy_window_ns", 0)
+	invalidate_ignore_cache()
+
+	for idx in range(southwark._ignore_cache_size + 4):
+		Repo.init(tmp_pathplus / str(idx), mkdir=True)
+		status(tmp_pathplus / str(idx))
+
+	# The least recently used repositories are discarded.
+	assert len(southwark._ignore_cache) == southwark._ignore_cache_size
+	assert str(tmp_pathplus / '0') not in southwark._ignore_cache
+
+	# As are repositories which no longer exist.
+	shutil.rmtree(tmp_pathplus / str(southwark._ignore_cache_size))
+	status(tmp_pathplus / '5')
+	assert len(southwark._ignore_cache) == southwark._ignore_cache_size - 1
+	assert list(southwark._ignore_cache)[-1] == str(tmp_pathplus / '5')
@@ -1,81 +1,173 @@
 # stdlib
+import gc
 import getpass
+import os
 import re
+import shutil
 import socket
+import tarfile
 from pathlib import Path
-from typing import List
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Sequence
 
 # 3rd party
 import pytest
-from apeye.requests_url import RequestsURL
+from coincidence.selectors import not_windows
 from domdf_python_tools.paths import PathPlus
 
 # this package
+import southwark.targit
 from southwark.targit import BadArchiveError, TarGit, check_archive_paths
 
 logo_url = "https://upload.wikimedia.org/wikipedia/commons/c/c3/Python-logo-notext.svg"
-python_logo = RequestsURL(logo_url).get().content
 
+exists_pattern = re.compile(r"TarGit file '.*' already exists\.")
+read_only_pattern = re.compile(r"Cannot write to TarGit file opened in read-only mode\.")
+closed_pattern = re.compile(r"IO operation on closed TarGit file\.")
+locked_pattern = re.compile(r"Unable to acquire a lock for the file '.*file\.tar\.gz'")
 
-def test_targit(tmp_pathplus: PathPlus, monkeypatch) -> None:
+
+@pytest.fixture(scope="session")
+def python_logo(pytestconfig) -> bytes:
+	# The contents don't matter, only that there is a non-trivial binary file,
+	# so the real logo is only downloaded when running with --online.
+	if not pytestconfig.getoption("online"):
+		return os.urandom(15000)
+
+	# The logo is kept in pytest's cache so it is only downloaded once, rather than on every run.
+	# The cache is unavailable if the cacheprovider plugin is disabled.
+	cache = getattr(pytestconfig, "cache", None)
+	if cache is not None:
+		cached = cache.get("southwark/python_logo", None)
+		if cached is not None:
+			return cached.encode("UTF-8")
+
+	# Only imported when needed, as it pulls in the http and ssl modules.
+	# stdlib
+	import urllib.request
+
+	with urllib.request.urlopen(logo_url) as response:
+		content = response.read()
+
+	if cache is not None:
+		cache.set("southwark/python_logo", content.decode("UTF-8"))
+
+	return content
+
+
+@pytest.fixture(scope="session")
+def sample_files(python_logo: bytes) -> Dict[str, bytes]:
+	return {
+			"foo.txt": b"Hello\nWorld\n",
+			"foo_v2.txt": b"Hello\nEveryone\n",
+			"script.sh": b"#!/bin/sh\necho Hello\n",
+			"logo.svg": python_logo,
+			}
+
+
+def assert_status(
+		targit: TarGit,
+		add: Sequence[str] = (),
+		delete: Sequence[str] = (),
+		modify: Sequence[str] = (),
+		) -> None:
+	assert targit.status() == {"add": list(add), "delete": list(delete), "modify": list(modify)}
+
+
+@pytest.fixture(autouse=True)
+def _patch_identity(monkeypatch) -> None:
+	# The identity recorded in each commit.
 	monkeypatch.setattr(socket, "gethostname", lambda *args: "southwark.local")
 	monkeypatch.setattr(getpass, "getuser", lambda *args: "user")
 
+
+@pytest.fixture()
+def w_targit(tmp_pathplus: PathPlus) -> Iterator[TarGit]:
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'w')
+	yield t
+	t.close()
+
+
+@pytest.fixture()
+def closed_targit(w_targit: TarGit, sample_files: Dict[str, bytes]) -> TarGit:
+	(w_targit / "foo.txt").write_bytes(sample_files["foo.txt"])
+	w_targit.save()
+	w_targit.close()
+	return w_targit
+
+
+@pytest.fixture(scope="module")
+def prebuilt_archive(tmp_path_factory, sample_files: Dict[str, bytes]) -> PathPlus:
+	# An archive with one saved file, built once and copied by the tests which need an existing archive.
+	filename = PathPlus(tmp_path_factory.mktemp("prebuilt")) / "file.tar.gz"
+
+	t = TarGit(filename, 'w')
+	(t / "foo.txt").write_bytes(sample_files["foo.txt"])
+	t.save()
+	t.close()
+
+	return filename
+
+
+def test_targit(tmp_pathplus: PathPlus, sample_files: Dict[str, bytes]) -> None:
 	t = TarGit(tmp_pathplus / "file.tar.gz", 'w')
 	assert (tmp_pathplus / "file.tar.gz.lock").is_file()
 	assert t.mode == 'w'
 
 	assert isinstance(t / "foo.txt", Path)
 	assert isinstance(t / "foo.txt", PathPlus)
-	(t / "foo.txt").write_clean("Hello\nWorld")
+	(t / "foo.txt").write_bytes(sample_files["foo.txt"])
 	assert (t / "foo.txt").exists()
 
-	assert t.status() == {"add": [PathPlus("foo.txt")], "delete": [], "modify": []}
+	assert_status(t, add=["foo.txt"])
 
 	assert t.save()
-	assert t.status() == {"add": [], "delete": [], "modify": []}
+	assert_status(t)
 
-	(t / "logo.svg").write_bytes(python_logo)
-	assert t.status() == {"add": [PathPlus("logo.svg")], "delete": [], "modify": []}
+	(t / "logo.svg").write_bytes(sample_files["logo.svg"])
+	assert_status(t, add=["logo.svg"])
 
 	assert t.save()
-	assert t.status() == {"add": [], "delete": [], "modify": []}
+	assert_status(t)
 
 	t.close()
 
 	t = TarGit(tmp_pathplus / "file.tar.gz", 'a')
-	assert t.status() == {"add": [], "delete": [], "modify": []}
+	assert_status(t)
 	assert t.mode == 'a'
 
-	(t / "foo.txt").write_clean("Hello\nEveryone")
-	assert t.status() == {"add": [], "delete": [], "modify": [PathPlus("foo.txt")]}
+	(t / "foo.txt").write_bytes(sample_files["foo_v2.txt"])
+	assert_status(t, modify=["foo.txt"])
 
 	assert t.save()
-	assert t.status() == {"add": [], "delete": [], "modify": []}
+	assert_status(t)
 	assert not t.save()
 
-	assert str(t).endswith("file.tar.gz")
-	assert re.match(r"TarGit\(.*file\.tar\.gz\)", repr(t))
+	filename = tmp_pathplus / "file.tar.gz"
+	assert str(t) == filename.as_posix()
+	assert repr(t) == f"TarGit({filename})"
+	assert os.fspath(t) == os.fspath(filename)
 
-	print(list(t.history))
+	history = list(t.history)
+	print(history)
 
-	for state in t.history:
+	for state in history:
 		assert state.device == socket.gethostname()
 		assert state.user == getpass.getuser()
 		assert len(state.id) == 40
 
-	assert len(list(t.history)) == 4
+	assert len(history) == 4
 
 	t.close()
 
-	with pytest.raises(FileExistsError, match="TarGit file '.*' already exists."):
+	with pytest.raises(FileExistsError, match=exists_pattern):
 		TarGit(tmp_pathplus / "file.tar.gz", 'w')
 
-	with pytest.raises(ValueError, match="Unknown IO mode 'wb'"):
-		TarGit(tmp_pathplus / "file.tar.gz", "wb")  # type: ignore
 
-	with pytest.raises(ValueError, match="Unknown IO mode 't'"):
-		TarGit(tmp_pathplus / "file.tar.gz", 't')  # type: ignore
+@pytest.mark.parametrize("mode", ["wb", 't'])
+def test_targit_bad_mode(tmp_pathplus: PathPlus, mode: str):
+	with pytest.raises(ValueError, match=f"Unknown IO mode '{mode}'"):
+		TarGit(tmp_pathplus / "file.tar.gz", mode)  # type: ignore
 
 
 def test_check_archive_paths():
@@ -97,3 +189,241 @@ def test_check_archive_paths():
 			match="Refusing to extract an archive containing files utilising path traversal.",
 			):
 		check_archive_paths(Archive())  # type: ignore
+
+
+def test_targit_bad_archive(tmp_pathplus: PathPlus):
+	payload = tmp_pathplus / "payload.txt"
+	payload.write_text("Hello World")
+
+	with tarfile.open(tmp_pathplus / "bad.tar.gz", mode="w:gz") as tf:
+		tf.add(payload, arcname="good.txt")
+		tf.add(payload, arcname="../evil.txt")
+
+	# In read mode the archive isn't extracted until its contents are accessed.
+	t = TarGit(tmp_pathplus / "bad.tar.gz", 'r')
+	with pytest.raises(BadArchiveError):
+		t / "good.txt"
+	t.close()
+
+	with pytest.raises(BadArchiveError):
+		TarGit(tmp_pathplus / "bad.tar.gz", 'a')
+
+
+# gzip has the same command line interface for compressing stdin to stdout,
+# so the pigz code path can be tested even where pigz isn't installed.
+@pytest.mark.parametrize("command", ["pigz", "gzip"])
+def test_targit_pigz(
+		tmp_pathplus: PathPlus,
+		monkeypatch,
+		w_targit: TarGit,
+		sample_files: Dict[str, bytes],
+		command: str,
+		):
+	executable = shutil.which(command)
+	if executable is None:  # pragma: no cover
+		pytest.skip(f"{command} is not available")
+
+	monkeypatch.setattr(southwark.targit, "igzip_threaded", None)
+	monkeypatch.setattr(southwark.targit, "_pigz", executable)
+	monkeypatch.setattr(southwark.targit, "_pigz_threshold", 0)
+
+	(w_targit / "foo.txt").write_bytes(sample_files["foo.txt"])
+	assert w_targit.save()
+	w_targit.close()
+
+	with tarfile.open(tmp_pathplus / "file.tar.gz", mode="r:gz") as tf:
+		assert "foo.txt" in tf.getnames()
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'r')
+	assert (t / "foo.txt").read_bytes() == sample_files["foo.txt"]
+	assert len(list(t.history)) == 2
+	t.close()
+
+
+def test_targit_pigz_small_archive(tmp_pathplus: PathPlus, monkeypatch, w_targit: TarGit):
+	# Small archives are compressed in-process, so this is never run.
+	monkeypatch.setattr(southwark.targit, "igzip_threaded", None)
+	monkeypatch.setattr(southwark.targit, "_pigz", str(tmp_pathplus / "does-not-exist"))
+
+	(w_targit / "foo.txt").write_bytes(b"Hello World")
+	assert w_targit.save()
+	w_targit.close()
+
+	with tarfile.open(tmp_pathplus / "file.tar.gz", mode="r:gz") as tf:
+		assert "foo.txt" in tf.getnames()
+
+
+def test_targit_stdlib(
+		tmp_pathplus: PathPlus,
+		monkeypatch,
+		w_targit: TarGit,
+		sample_files: Dict[str, bytes],
+		):
+	# As though none of the optional accelerators were installed.
+	monkeypatch.setattr(southwark.targit, "igzip", None)
+	monkeypatch.setattr(southwark.targit, "igzip_threaded", None)
+	monkeypatch.setattr(southwark.targit, "rapidgzip", None)
+	monkeypatch.setattr(southwark.targit, "_pigz", None)
+
+	modes = []
+	tarfile_open = tarfile.open
+
+	def spy_open(*args, **kwargs):
+		modes.append(kwargs.get("mode", args[1] if len(args) > 1 else 'r'))
+		return tarfile_open(*args, **kwargs)
+
+	monkeypatch.setattr(tarfile, "open", spy_open)
+
+	(w_targit / "foo.txt").write_bytes(sample_files["foo.txt"])
+	(w_targit / "logo.svg").write_bytes(sample_files["logo.svg"])
+	assert w_targit.save()
+	w_targit.close()
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'r')
+	assert (t / "foo.txt").read_bytes() == sample_files["foo.txt"]
+	assert (t / "logo.svg").read_bytes() == sample_files["logo.svg"]
+	assert len(list(t.history)) == 2
+	t.close()
+
+	assert "w:gz" in modes
+	assert "r:gz" in modes
+
+
+def test_targit_isal(
+		tmp_pathplus: PathPlus,
+		monkeypatch,
+		w_targit: TarGit,
+		sample_files: Dict[str, bytes],
+		):
+	isal = pytest.importorskip("isal")
+
+	monkeypatch.setattr(southwark.targit, "_pigz", None)
+	monkeypatch.setattr(southwark.targit, "rapidgzip", None)
+
+	opened = []
+
+	def igzip_open(*args, **kwargs):
+		opened.append(args)
+		return isal.igzip.open(*args, **kwargs)
+
+	monkeypatch.setattr(southwark.targit, "igzip", SimpleNamespace(open=igzip_open))
+
+	(w_targit / "foo.txt").write_bytes(sample_files["foo.txt"])
+	(w_targit / "logo.svg").write_bytes(sample_files["logo.svg"])
+	assert w_targit.save()
+	w_targit.close()
+
+	# The threaded writer's output is a standard .tar.gz file.
+	with tarfile.open(tmp_pathplus / "file.tar.gz", mode="r:gz") as tf:
+		assert {"foo.txt", "logo.svg"} <= set(tf.getnames())
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'r')
+	assert (t / "foo.txt").read_bytes() == sample_files["foo.txt"]
+	assert (t / "logo.svg").read_bytes() == sample_files["logo.svg"]
+	assert len(list(t.history)) == 2
+	t.close()
+
+	assert len(opened) == 1
+
+
+def test_targit_rapidgzip(tmp_pathplus: PathPlus, monkeypatch, w_targit: TarGit):
+	rapidgzip = pytest.importorskip("rapidgzip")
+
+	opened = []
+
+	def rapidgzip_open(*args, **kwargs):
+		opened.append(args)
+		return rapidgzip.open(*args, **kwargs)
+
+	monkeypatch.setattr(southwark.targit, "rapidgzip", SimpleNamespace(open=rapidgzip_open))
+
+	# Random data doesn't compress, so the archive ends up above the threshold.
+	payload = os.urandom(southwark.targit._parallel_read_threshold + 1024 * 1024)
+	(w_targit / "payload.bin").write_bytes(payload)
+	assert w_targit.save()
+	w_targit.close()
+	assert (tmp_pathplus / "file.tar.gz").stat().st_size > southwark.targit._parallel_read_threshold
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'r')
+	assert (t / "payload.bin").read_bytes() == payload
+	assert len(list(t.history)) == 2
+	t.close()
+
+	assert len(opened) == 1
+
+
+def test_targit_read_only(tmp_pathplus: PathPlus, prebuilt_archive: PathPlus, sample_files: Dict[str, bytes]):
+	shutil.copy2(prebuilt_archive, tmp_pathplus / "file.tar.gz")
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'r')
+	assert t.mode == 'r'
+	assert not (tmp_pathplus / "file.tar.gz.lock").exists()
+	assert (t / "foo.txt").read_bytes() == sample_files["foo.txt"]
+	assert_status(t)
+	assert len(list(t.history)) == 2
+
+	with pytest.raises(OSError, match=read_only_pattern):
+		t.save()
+
+	t.close()
+
+
+def test_targit_locked(tmp_pathplus: PathPlus, prebuilt_archive: PathPlus):
+	shutil.copy2(prebuilt_archive, tmp_pathplus / "file.tar.gz")
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'a')
+
+	with pytest.raises(OSError, match=locked_pattern):
+		TarGit(tmp_pathplus / "file.tar.gz", 'a', lock_timeout=0)
+
+	t.close()
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'a', lock_timeout=0)
+	assert t.mode == 'a'
+	t.close()
+
+	# The in-process lock is discarded once no TarGit is using it.
+	del t
+	gc.collect()
+	assert str((tmp_pathplus / "file.tar.gz").resolve()) not in southwark.targit._process_locks
+
+
+@pytest.mark.parametrize("lock_timeout", [-1, -2, -0.5])
+def test_targit_lock_timeout_negative(tmp_pathplus: PathPlus, prebuilt_archive: PathPlus, lock_timeout: float):
+	shutil.copy2(prebuilt_archive, tmp_pathplus / "file.tar.gz")
+
+	# Any negative value waits indefinitely, which succeeds at once on an unlocked archive.
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'a', lock_timeout=lock_timeout)
+	assert t.mode == 'a'
+	t.close()
+
+
+@not_windows(reason="Windows has no executable bit")
+def test_targit_executable(tmp_pathplus: PathPlus, w_targit: TarGit, sample_files: Dict[str, bytes]):
+	(w_targit / "script.sh").write_bytes(sample_files["script.sh"])
+	(w_targit / "script.sh").chmod(0o755)
+	(w_targit / "foo.txt").write_bytes(sample_files["foo.txt"])
+	assert w_targit.save()
+	w_targit.close()
+
+	t = TarGit(tmp_pathplus / "file.tar.gz", 'a')
+	assert os.access(t / "script.sh", os.X_OK)
+	assert not os.access(t / "foo.txt", os.X_OK)
+	assert_status(t)
+	t.close()
+
+
+def test_targit_closed(closed_targit: TarGit):
+	assert closed_targit.closed
+
+	with pytest.raises(OSError, match=closed_pattern):
+		closed_targit.save()
+
+	with pytest.raises(OSError, match=closed_pattern):
+		closed_targit.status()
+
+	with pytest.raises(OSError, match=closed_pattern):
+		list(closed_targit.history)
+
+	# Closing again is harmless.
+	closed_targit.close()
+	assert closed_targit.closed